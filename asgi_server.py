@@ -0,0 +1,179 @@
+import asyncio
+import os
+
+from quart import Quart, Response, jsonify, request
+from quart_cors import cors
+
+import server
+from openai_clients import get_async_client
+from run_executor import RunDeadlineExceeded
+from sessions import SessionManager
+from metrics import registry, timed
+
+# Asyncio-native serving mode for the same routes as server.py. Every OpenAI wait
+# is awaited on the event loop instead of holding a worker thread, so one process
+# can keep thousands of tutor runs in flight. Run with:
+#   hypercorn asgi_server:app --bind 0.0.0.0:5001
+
+app = cors(Quart(__name__))
+
+
+class AsyncOpenAIChat(server.OpenAIChat):
+    # Same chat state and turn logic; only the assistant runs are awaited
+    def __init__(self, api_key):
+        super().__init__(api_key)
+        self.async_client = get_async_client(api_key)
+
+    async def send_message_async(self, message, on_delta=None):
+        with timed('help_detection'):
+            user_asking_for_help = server.help_classifier.classify(message, self.language)
+            if user_asking_for_help is None:
+                user_asking_for_help = await self.detect_help_request_async(message)
+        print("User is asking for help?:", user_asking_for_help )
+
+        turn = self.prepare_turn(message, user_asking_for_help)
+
+        with timed('tutor_run'):
+            try:
+                event_handler = await server.role_engines['tutor'].reply_async(self, turn, sinks=[on_delta] if on_delta else None)
+            except BaseException:
+                self.abandon_turn(turn)
+                raise
+        server.record_first_token(event_handler)
+
+        return self.finish_turn(turn, event_handler.current_response)
+
+    async def detect_help_request_async(self, message):
+        with timed('help_detection_assistant'):
+            try:
+                response_json = await self.run_classifier_async('help_detector', message)
+            except RunDeadlineExceeded as e:
+                # Carry on with the normal conversation rather than hold up the turn
+                print(f"{e}, treating the message as not asking for help")
+                return 'no'
+        return response_json.get('user_asking_for_help', 0)
+
+
+sessions = SessionManager(
+    chat_factory=lambda session_id: server.load_chat(session_id, AsyncOpenAIChat),
+    capacity=int(os.getenv('MAX_SESSIONS', 1000)),
+    idle_ttl=float(os.getenv('SESSION_IDLE_TTL', 1800)),
+    on_evict=server.evict_chat,
+)
+
+
+@app.route('/set-up-chat', methods=['POST'])
+async def set_up_chat():
+    data = await request.get_json()
+    conversation_topic = data.get('conversation_topic')
+    users_rating = data.get('users_rating', 300)  # Default to 300 if not provided
+    language = data.get('language', 'Spanish')
+
+    # A cold session is loaded from the state store, which sessions.async_locked does off the loop
+    async with sessions.async_locked(server.get_session_id(data)) as session:
+        chat = session.chat
+        await asyncio.to_thread(chat.sync_state)
+        chat.set_chat_topic(conversation_topic)
+        chat.set_language(language)
+        chat.users_rating = int(users_rating)
+        chat.save_state()
+    return 'Chat Set Up'
+
+
+@app.route('/generate-response', methods=['POST'])
+async def generate_response():
+    data = await request.get_json()
+    async with sessions.async_locked(server.get_session_id(data)) as session:
+        await asyncio.to_thread(session.chat.sync_state)
+        try:
+            bots_response, users_rating = await session.chat.send_message_async(data.get('input'))
+        except RunDeadlineExceeded as e:
+            return jsonify({'error': str(e)}), 504
+    return jsonify({'data': bots_response, 'users_rating': users_rating})
+
+
+@app.route('/generate-response-stream', methods=['POST'])
+async def generate_response_stream():
+    data = await request.get_json()
+    session_id = server.get_session_id(data)
+    events = asyncio.Queue()
+
+    async def run_turn():
+        try:
+            async with sessions.async_locked(session_id) as session:
+                await asyncio.to_thread(session.chat.sync_state)
+                bots_response, users_rating = await session.chat.send_message_async(
+                    data.get('input'), on_delta=lambda text: events.put_nowait(('delta', {'delta': text}))
+                )
+            users_rating, pending = await asyncio.to_thread(session.chat.wait_for_rating, server.SCORING_TIMEOUT)
+            events.put_nowait(('done', {'data': bots_response, 'users_rating': users_rating}))
+        except Exception as e:
+            print(f"Streaming turn failed: {e}")
+            events.put_nowait(('error', {'message': str(e)}))
+        finally:
+            events.put_nowait(None)
+
+    asyncio.create_task(run_turn())
+
+    async def event_stream():
+        while True:
+            event = await events.get()
+            if event is None:
+                break
+            yield server.format_sse(*event)
+
+    response = Response(event_stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.timeout = None
+    return response
+
+
+@app.route('/users-rating', methods=['POST'])
+async def users_rating():
+    data = await request.get_json(silent=True) or {}
+    wait = server.parse_wait(data)
+    if wait is None:
+        return jsonify({'message': "'wait' must be a number of seconds."}), 400
+    session_id = server.get_session_id(data)
+    session = sessions.peek(session_id)
+    if session is None:
+        rating = await asyncio.to_thread(server.stored_rating, session_id)
+        if rating is None:
+            return jsonify({'message': 'Chat has not been set up.'}), 404
+        return jsonify(rating), 200
+    chat = session.chat
+    users_rating, pending = await asyncio.to_thread(chat.wait_for_rating, wait)
+    return jsonify({'users_rating': users_rating, 'pending': pending, 'version': chat.rating_version}), 200
+
+
+@app.route('/reset-chat', methods=['POST'])
+async def reset_chat():
+    data = await request.get_json(silent=True) or {}
+    async with sessions.async_locked(server.get_session_id(data), create=False) as session:
+        if session is not None:
+            await asyncio.to_thread(session.chat.sync_state)
+            # Retires the old tutor thread through the sync client
+            await asyncio.to_thread(session.chat.reset_chat)
+    return jsonify({'message': 'Chat has been reset.'}), 200
+
+
+@app.route('/ready', methods=['GET'])
+async def ready():
+    nlp_resources = server.nlp_resources
+    status = {'ready': nlp_resources.is_ready(), 'loaded': nlp_resources.loaded()}
+    if nlp_resources.warm_up_error:
+        status['error'] = nlp_resources.warm_up_error
+    return jsonify(status), 200 if status['ready'] else 503
+
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/check-server', methods=['GET'])
+async def check_server():
+    return jsonify({'server': 'Quart (ASGI)'}), 200
+
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=5001)
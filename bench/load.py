@@ -0,0 +1,171 @@
+import argparse
+import json
+import math
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from bench.traffic import by_session, load_traffic, synthesize_traffic, write_traffic
+
+# Replays recorded (or synthesized) learner traffic against a running server and
+# reports throughput plus p50/p95/p99 per route and per turn stage. Typical run:
+#   python -m bench.stub_openai --port 8100 &
+#   OPENAI_BASE_URL=http://127.0.0.1:8100/v1 OPENAI_API_KEY=stub gunicorn -w 4 server:app -b 127.0.0.1:5001 &
+#   python -m bench.load --target http://127.0.0.1:5001 --concurrency 32
+# Route latencies are measured here; stage latencies come from the server's
+# /metrics histograms, diffed over the run (one worker's view under gunicorn).
+
+DEFAULT_TRAFFIC_PATH = os.path.join(os.path.dirname(__file__), 'traffic.jsonl')
+QUANTILES = (0.5, 0.95, 0.99)
+BUCKET_LINE = re.compile(r'^converso_stage_seconds_bucket\{(.*)\} (\S+)$')
+
+
+def percentile(samples, q):
+    if not samples:
+        return float('nan')
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+class Results:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def add(self, route, seconds, ok=True):
+        with self._lock:
+            self.latencies.setdefault(route, []).append(seconds)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+
+def send(http, target, record, results, timeout):
+    route, body = record['route'], record['body']
+    started = time.perf_counter()
+    try:
+        response = http.post(target + route, json=body, timeout=timeout, stream=route.endswith('-stream'))
+        if route.endswith('-stream'):
+            first = None
+            for chunk in response.iter_content(chunk_size=None):
+                if first is None and chunk:
+                    first = time.perf_counter() - started
+                    results.add(route + ' (first byte)', first)
+        ok = response.ok
+    except requests.RequestException as e:
+        print(f"{route} failed: {e}")
+        ok = False
+    results.add(route, time.perf_counter() - started, ok)
+
+
+def replay_session(target, records, results, timeout, pace):
+    http = requests.Session()
+    started = time.monotonic()
+    for record in records:
+        if pace:
+            # Keep the recorded think time between this session's requests
+            time.sleep(max(0, record.get('t', 0) / pace - (time.monotonic() - started)))
+        send(http, target, record, results, timeout)
+
+
+def scrape_stages(target):
+    # {(stage, le): cumulative count} from the converso_stage_seconds histogram
+    buckets = {}
+    try:
+        text = requests.get(target + '/metrics', timeout=10).text
+    except requests.RequestException:
+        return buckets
+    for line in text.splitlines():
+        match = BUCKET_LINE.match(line)
+        if match:
+            labels = dict(re.findall(r'(\w+)="([^"]*)"', match.group(1)))
+            buckets[(labels.get('stage', ''), labels['le'])] = float(match.group(2))
+    return buckets
+
+
+def stage_quantiles(before, after):
+    # Same interpolation as Prometheus' histogram_quantile, over the run's increase
+    stages = {}
+    for (stage, le), count in after.items():
+        bound = float('inf') if le == '+Inf' else float(le)
+        stages.setdefault(stage, []).append((bound, count - before.get((stage, le), 0)))
+    report = {}
+    for stage, buckets in stages.items():
+        buckets.sort()
+        total = buckets[-1][1]
+        if total <= 0:
+            continue
+        row = {'count': int(total)}
+        for q in QUANTILES:
+            rank, lower, previous = q * total, 0.0, 0.0
+            for bound, cumulative in buckets:
+                if cumulative >= rank:
+                    if math.isinf(bound):
+                        value = lower
+                    else:
+                        value = lower + (bound - lower) * (rank - previous) / max(cumulative - previous, 1e-9)
+                    break
+                lower, previous = bound, cumulative
+            row[f"p{int(q * 100)}"] = value
+        report[stage] = row
+    return report
+
+
+def format_table(title, rows):
+    lines = [title, f"  {'name':<40}{'count':>8}{'p50':>10}{'p95':>10}{'p99':>10}"]
+    for name, row in sorted(rows.items()):
+        lines.append(f"  {name:<40}{row['count']:>8}" + "".join(f"{row[f'p{int(q * 100)}'] * 1000:>8.0f}ms" for q in QUANTILES))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay learner traffic against the server and report latency percentiles.')
+    parser.add_argument('--target', default='http://127.0.0.1:5001')
+    parser.add_argument('--traffic', default=DEFAULT_TRAFFIC_PATH, help='JSONL written by RECORD_TRAFFIC_PATH or --synthesize.')
+    parser.add_argument('--synthesize', type=int, metavar='SESSIONS', help='Write synthetic traffic for this many sessions to --traffic first.')
+    parser.add_argument('--turns', type=int, default=5, help='Messages per synthetic session.')
+    parser.add_argument('--stream', action='store_true', help='Synthesize /generate-response-stream turns instead.')
+    parser.add_argument('--concurrency', type=int, default=16, help='Sessions replayed at once.')
+    parser.add_argument('--pace', type=float, default=0, help='Replay recorded think time sped up by this factor; 0 sends back to back.')
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--json', dest='json_path', help='Also write the report here as JSON.')
+    args = parser.parse_args()
+
+    if args.synthesize:
+        write_traffic(args.traffic, synthesize_traffic(args.synthesize, args.turns, stream=args.stream))
+    sessions = by_session(load_traffic(args.traffic))
+    print(f"Replaying {sum(map(len, sessions))} requests from {len(sessions)} sessions at concurrency {args.concurrency}")
+
+    results = Results()
+    stages_before = scrape_stages(args.target)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for future in [executor.submit(replay_session, args.target, records, results, args.timeout, args.pace) for records in sessions]:
+            future.result()
+    elapsed = time.perf_counter() - started
+    stages = stage_quantiles(stages_before, scrape_stages(args.target))
+
+    routes = {
+        route: dict({'count': len(samples), 'errors': results.errors.get(route, 0)},
+                    **{f"p{int(q * 100)}": percentile(samples, q) for q in QUANTILES})
+        for route, samples in results.latencies.items()
+    }
+    requests_sent = sum(len(samples) for route, samples in results.latencies.items() if not route.endswith('(first byte)'))
+    print(f"{requests_sent} requests in {elapsed:.1f}s: {requests_sent / elapsed:.1f} req/s, "
+          f"{sum(results.errors.values())} errors")
+    print(format_table("Routes", routes))
+    if stages:
+        print(format_table("Stages (from /metrics)", stages))
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'elapsed_seconds': elapsed, 'requests': requests_sent, 'throughput': requests_sent / elapsed,
+                       'routes': routes, 'stages': stages}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
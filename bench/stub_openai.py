@@ -0,0 +1,230 @@
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+
+from flask import Flask, Response, jsonify, request
+
+from openai_clients import ASSISTANT_IDS
+
+# Local stand-in for the parts of the OpenAI API the server uses: assistants,
+# threads, streaming runs and chat completions. Replies are canned, so load tests
+# measure our own overhead plus a configurable model latency. Run with:
+#   python -m bench.stub_openai --port 8100 --latency tutor=0.8:0.5 --token-delay 0.02
+# and start the server with OPENAI_BASE_URL=http://127.0.0.1:8100/v1 OPENAI_API_KEY=stub
+
+app = Flask(__name__)
+
+ROLES_BY_ASSISTANT = {assistant_id: role for role, assistant_id in ASSISTANT_IDS.items()}
+
+TUTOR_REPLY = (
+    "¡Qué buena idea! Me encanta hablar de eso. Cuéntame un poco más: ¿qué haces normalmente "
+    "los fines de semana y con quién te gusta pasar el tiempo libre?"
+)
+HELP_WORDS = re.compile(r"help|ayuda|mean|what is|how do|translate|understand|\?", re.IGNORECASE)
+
+# Set from the command line in main()
+settings = {
+    'latency': {},  # role -> (median seconds before the first token, lognormal sigma)
+    'default_latency': (0.3, 0.5),
+    'token_delay': 0.01,
+    'error_rate': 0.0,
+    'seed': None,
+}
+_ids = itertools.count(1)
+_ids_lock = threading.Lock()
+
+
+def new_id(prefix):
+    with _ids_lock:
+        return f"{prefix}_stub{next(_ids)}"
+
+
+def run_latency(role):
+    median, sigma = settings['latency'].get(role, settings['default_latency'])
+    return random.lognormvariate(0, sigma) * median if median > 0 else 0
+
+
+def canned_reply(role, content):
+    # Deterministic per input, like the real classifiers are close to being
+    rng = random.Random(content)
+    if role == 'help_detector':
+        return json.dumps({'user_asking_for_help': 'yes' if HELP_WORDS.search(content) else 'no'})
+    if role == 'response_score':
+        return json.dumps({'Overall Score': round(rng.uniform(0.3, 1.0), 2)})
+    if role == 'english_word_counter':
+        words = re.findall(r"\b[a-zA-Z]+\b", content)
+        return json.dumps({'number_of_english_words': sum(1 for word in words if rng.random() < 0.2)})
+    if role == 'advanced_word_detector':
+        return json.dumps({'advanced_words': []})
+    if role == 'mistake_detector':
+        return json.dumps({'mistakes': []})
+    return TUTOR_REPLY
+
+
+def tokens(text):
+    return re.findall(r"\S+\s*", text)
+
+
+def usage(prompt, reply):
+    prompt_tokens, completion_tokens = len(prompt) // 4 + 1, len(tokens(reply))
+    return {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens, 'total_tokens': prompt_tokens + completion_tokens}
+
+
+def maybe_fail():
+    if settings['error_rate'] and random.random() < settings['error_rate']:
+        return jsonify({'error': {'message': 'Injected stub failure', 'type': 'server_error', 'code': 'server_error'}}), 500
+    return None
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route('/v1/assistants/<assistant_id>', methods=['GET'])
+def retrieve_assistant(assistant_id):
+    return jsonify({
+        'id': assistant_id, 'object': 'assistant', 'created_at': int(time.time()),
+        'name': ROLES_BY_ASSISTANT.get(assistant_id, 'stub'), 'description': None, 'model': 'stub',
+        'instructions': '', 'tools': [], 'metadata': {},
+    })
+
+
+@app.route('/v1/threads', methods=['POST'])
+def create_thread():
+    return jsonify({'id': new_id('thread'), 'object': 'thread', 'created_at': int(time.time()), 'metadata': {}, 'tool_resources': {}})
+
+
+@app.route('/v1/threads/<thread_id>', methods=['DELETE'])
+def delete_thread(thread_id):
+    return jsonify({'id': thread_id, 'object': 'thread.deleted', 'deleted': True})
+
+
+@app.route('/v1/threads/<thread_id>/runs/<run_id>/cancel', methods=['POST'])
+def cancel_run(thread_id, run_id):
+    return jsonify(run_object(run_id, thread_id, '', 'cancelled'))
+
+
+def run_object(run_id, thread_id, assistant_id, status, run_usage=None):
+    return {
+        'id': run_id, 'object': 'thread.run', 'created_at': int(time.time()), 'thread_id': thread_id,
+        'assistant_id': assistant_id, 'status': status, 'model': 'stub', 'instructions': '', 'tools': [],
+        'last_error': None, 'usage': run_usage, 'metadata': {}, 'parallel_tool_calls': False,
+    }
+
+
+@app.route('/v1/threads/<thread_id>/runs', methods=['POST'])
+def create_run(thread_id):
+    failure = maybe_fail()
+    if failure is not None:
+        return failure
+    body = request.get_json(silent=True) or {}
+    assistant_id = body.get('assistant_id', '')
+    role = ROLES_BY_ASSISTANT.get(assistant_id, 'tutor')
+    prompt = " ".join(str(message.get('content', '')) for message in body.get('additional_messages') or [])
+    reply = canned_reply(role, prompt)
+    run_id, message_id = new_id('run'), new_id('msg')
+    latency = run_latency(role)
+
+    def events():
+        yield sse('thread.run.created', run_object(run_id, thread_id, assistant_id, 'queued'))
+        yield sse('thread.run.in_progress', run_object(run_id, thread_id, assistant_id, 'in_progress'))
+        time.sleep(latency)
+        message = {
+            'id': message_id, 'object': 'thread.message', 'created_at': int(time.time()), 'thread_id': thread_id,
+            'role': 'assistant', 'content': [], 'assistant_id': assistant_id, 'run_id': run_id,
+            'attachments': [], 'metadata': {}, 'status': 'in_progress',
+        }
+        yield sse('thread.message.created', message)
+        for index, token in enumerate(tokens(reply)):
+            if index and settings['token_delay']:
+                time.sleep(settings['token_delay'])
+            yield sse('thread.message.delta', {
+                'id': message_id, 'object': 'thread.message.delta',
+                'delta': {'content': [{'index': 0, 'type': 'text', 'text': {'value': token, 'annotations': []}}]},
+            })
+        message.update(status='completed', content=[{'type': 'text', 'text': {'value': reply, 'annotations': []}}])
+        yield sse('thread.message.completed', message)
+        yield sse('thread.run.completed', run_object(run_id, thread_id, assistant_id, 'completed', usage(prompt, reply)))
+        yield "event: done\ndata: [DONE]\n\n"
+
+    return Response(events(), mimetype='text/event-stream')
+
+
+@app.route('/v1/chat/completions', methods=['POST'])
+def chat_completions():
+    failure = maybe_fail()
+    if failure is not None:
+        return failure
+    body = request.get_json(silent=True) or {}
+    messages = body.get('messages') or [{}]
+    prompt = str(messages[-1].get('content', ''))
+    # Classifier roles ask for JSON; the role is named in the schema when there is one
+    schema_name = ((body.get('response_format') or {}).get('json_schema') or {}).get('name', '')
+    role = schema_name if schema_name in ASSISTANT_IDS else 'tutor'
+    reply = canned_reply(role, prompt)
+    completion_id = new_id('chatcmpl')
+    latency = run_latency(role)
+
+    if not body.get('stream'):
+        time.sleep(latency + settings['token_delay'] * len(tokens(reply)))
+        return jsonify({
+            'id': completion_id, 'object': 'chat.completion', 'created': int(time.time()), 'model': body.get('model', 'stub'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': reply}, 'finish_reason': 'stop'}],
+            'usage': usage(prompt, reply),
+        })
+
+    def chunks():
+        time.sleep(latency)
+        for index, token in enumerate(tokens(reply)):
+            if index and settings['token_delay']:
+                time.sleep(settings['token_delay'])
+            yield "data: " + json.dumps({
+                'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': 'stub',
+                'choices': [{'index': 0, 'delta': {'content': token}, 'finish_reason': None}],
+            }) + "\n\n"
+        yield "data: " + json.dumps({
+            'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': 'stub',
+            'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}], 'usage': usage(prompt, reply),
+        }) + "\n\n"
+        yield "data: [DONE]\n\n"
+
+    return Response(chunks(), mimetype='text/event-stream')
+
+
+def parse_latency(values):
+    # ["tutor=0.8:0.5", "help_detector=0.2"] -> {"tutor": (0.8, 0.5), "help_detector": (0.2, 0.5)}
+    latency = {}
+    for value in values:
+        role, _, spec = value.partition('=')
+        median, _, sigma = spec.partition(':')
+        latency[role] = (float(median), float(sigma or 0.5))
+    return latency
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stub of the OpenAI Assistants API for load tests.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--latency', action='append', default=[], metavar='ROLE=MEDIAN[:SIGMA]',
+                        help='Lognormal time to first token per role, in seconds.')
+    parser.add_argument('--default-latency', default='0.3:0.5', metavar='MEDIAN[:SIGMA]')
+    parser.add_argument('--token-delay', type=float, default=0.01, help='Seconds between streamed tokens.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of runs that fail with a 500.')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    settings['latency'] = parse_latency(args.latency)
+    settings['default_latency'] = parse_latency([f"default={args.default_latency}"])['default']
+    settings['token_delay'] = args.token_delay
+    settings['error_rate'] = args.error_rate
+    if args.seed is not None:
+        random.seed(args.seed)
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
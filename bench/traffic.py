@@ -0,0 +1,73 @@
+import json
+import random
+import threading
+import time
+
+# Routes worth replaying; everything else the server serves is read-only
+RECORDED_ROUTES = ('/set-up-chat', '/generate-response', '/generate-response-stream')
+
+SAMPLE_MESSAGES = [
+    "Hola, me llamo Ana y vivo en Madrid.",
+    "Me gusta jugar al fútbol con mis amigos los sábados.",
+    "What does 'entonces' mean?",
+    "Ayer fui a la playa con mi familia y comimos paella.",
+    "No entiendo, can you explain that again?",
+    "Mi comida favorita es la pizza, pero también me gustan los tacos.",
+    "I think que el tiempo está muy bonito hoy.",
+    "¿Cómo se dice 'weekend' en español?",
+    "Trabajo en una oficina en el centro de la ciudad.",
+    "El verano que viene vamos a viajar a México.",
+]
+SAMPLE_TOPICS = ["general conversation", "introductions", "weather", "sports", "music", "travel", "food"]
+
+
+class TrafficRecorder:
+    # Appends each recorded request as one JSON line: seconds since recording
+    # started, route and body. Enabled in server.py with RECORD_TRAFFIC_PATH.
+    def __init__(self, path):
+        self.path = path
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, route, body):
+        if route not in RECORDED_ROUTES:
+            return
+        line = json.dumps({'t': round(time.monotonic() - self.started, 3), 'route': route, 'body': body}, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+
+
+def load_traffic(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def synthesize_traffic(sessions, turns, language='Spanish', seed=0, stream=False):
+    # A set-up call followed by `turns` messages for each of `sessions` learners
+    rng = random.Random(seed)
+    route = '/generate-response-stream' if stream else '/generate-response'
+    records = []
+    for index in range(sessions):
+        session_id = f"bench-{index}"
+        records.append({'t': 0, 'route': '/set-up-chat', 'body': {
+            'session_id': session_id, 'language': language,
+            'conversation_topic': rng.choice(SAMPLE_TOPICS), 'users_rating': rng.randrange(100, 1300, 50),
+        }})
+        for _ in range(turns):
+            records.append({'t': 0, 'route': route, 'body': {'session_id': session_id, 'input': rng.choice(SAMPLE_MESSAGES)}})
+    return records
+
+
+def write_traffic(path, records):
+    with open(path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def by_session(records):
+    # Requests of one session keep their recorded order; sessions replay independently
+    sessions = {}
+    for record in records:
+        sessions.setdefault(record['body'].get('session_id', 'default'), []).append(record)
+    return list(sessions.values())
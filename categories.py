@@ -0,0 +1,76 @@
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+
+DEFAULT_CATEGORY = "General Conversation"
+
+# One CEFR level of one category, with the strings the prompt needs already joined
+CategoryLevel = namedtuple('CategoryLevel', ['vocabulary', 'vocabulary_str', 'grammar', 'grammar_str'])
+
+
+def build_category_index(raw_categories):
+    # category -> CEFR level -> CategoryLevel, all read-only
+    index = {}
+    for category, levels in raw_categories.items():
+        category_levels = {}
+        for level, level_data in levels.items():
+            vocabulary = tuple(level_data.get("vocabulary", []))
+            grammar = tuple(level_data.get("grammar", []))
+            category_levels[level] = CategoryLevel(
+                vocabulary=vocabulary,
+                vocabulary_str=", ".join(vocabulary),
+                grammar=grammar,
+                grammar_str=", ".join(grammar),
+            )
+        index[category] = MappingProxyType(category_levels)
+    return MappingProxyType(index)
+
+
+class CategoryIndex:
+    # Parses each <language>_categories.json once and serves the parsed index from
+    # memory. The file's mtime is re-checked at most every reload_interval seconds,
+    # and the index is rebuilt only when the file has actually changed.
+    def __init__(self, directory=None, reload_interval=5.0):
+        self.directory = directory or os.path.dirname(os.path.abspath(__file__))
+        self.reload_interval = reload_interval
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def path_for(self, language):
+        return os.path.join(self.directory, f"{language.lower()}_categories.json")
+
+    def get(self, language):
+        key = language.lower()
+        entry = self._indexes.get(key)
+        if entry is not None and time.monotonic() - entry[2] < self.reload_interval:
+            return entry[1]
+        return self._refresh(key, entry)
+
+    def get_level(self, language, cefr_level, category=DEFAULT_CATEGORY):
+        return self.get(language).get(category, {}).get(cefr_level)
+
+    def languages(self):
+        suffix = "_categories.json"
+        return sorted(name[:-len(suffix)] for name in os.listdir(self.directory) if name.endswith(suffix))
+
+    def preload(self):
+        for language in self.languages():
+            self.get(language)
+
+    def _refresh(self, key, entry):
+        with self._lock:
+            path = self.path_for(key)
+            mtime = os.stat(path).st_mtime
+            current = self._indexes.get(key)
+            if current is not None and current[0] == mtime:
+                index = current[1]
+            else:
+                with open(path, 'r') as file:
+                    index = build_category_index(json.load(file))
+                if current is not None:
+                    print(f"Reloaded {path}")
+            self._indexes[key] = (mtime, index, time.monotonic())
+            return index
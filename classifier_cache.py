@@ -0,0 +1,155 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import registry
+
+MISS = object()
+
+cache_lookups = registry.counter('converso_classifier_cache_lookups_total', 'Classifier cache lookups by role and result (hit, shared_hit or miss).')
+
+_PUNCTUATION_EDGES = re.compile(r"^[\s¿¡.,!?…]+|[\s.,!?…]+$")
+
+
+def normalize_input(text):
+    # 'No entiendo!!' and '  no   entiendo ' share an entry
+    return _PUNCTUATION_EDGES.sub("", " ".join(text.lower().split()))
+
+
+class SharedCacheStore:
+    # SQLite file that every worker on the host reads and writes, so one worker's
+    # classifier result saves the others a run as well. Expired rows are deleted
+    # on open and every prune_every puts, so the file stays about one TTL's worth.
+    def __init__(self, path, prune_every=1000):
+        self.prune_every = prune_every
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS classifier_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS classifier_cache_expires_at ON classifier_cache (expires_at)")
+            self._connection.commit()
+        self.prune()
+
+    def get(self, key):
+        with self._lock:
+            row = self._connection.execute("SELECT value, expires_at FROM classifier_cache WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return MISS
+        return json.loads(row[0])
+
+    def put(self, key, value, expires_at):
+        with self._lock:
+            with self._connection:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO classifier_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), expires_at),
+                )
+            self._puts += 1
+            due = self._puts % self.prune_every == 0
+        if due:
+            self.prune()
+
+    def prune(self, now=None):
+        with self._lock:
+            with self._connection:
+                cursor = self._connection.execute(
+                    "DELETE FROM classifier_cache WHERE expires_at < ?", (time.time() if now is None else now,)
+                )
+        return cursor.rowcount
+
+
+class ClassifierCache:
+    # LRU + TTL cache of classifier assistant results, keyed by assistant id and the
+    # normalized input. An optional SharedCacheStore sits behind the in-memory LRU.
+    def __init__(self, max_size=10000, ttl=3600, shared_store=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.shared_store = shared_store
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, assistant_id, text, role=''):
+        key = f"{assistant_id}:{normalize_input(text)}"
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at >= now:
+                    self._entries.move_to_end(key)
+                    cache_lookups.inc(role=role, result='hit')
+                    return value
+                del self._entries[key]
+        if self.shared_store is not None:
+            try:
+                value = self.shared_store.get(key)
+            except sqlite3.Error as e:
+                print(f"Shared classifier cache read failed: {e}")
+                value = MISS
+            if value is not MISS:
+                self._remember(key, value, now + self.ttl)
+                cache_lookups.inc(role=role, result='shared_hit')
+                return value
+        cache_lookups.inc(role=role, result='miss')
+        return MISS
+
+    def put(self, assistant_id, text, value):
+        key = f"{assistant_id}:{normalize_input(text)}"
+        expires_at = time.time() + self.ttl
+        self._remember(key, value, expires_at)
+        if self.shared_store is not None:
+            try:
+                self.shared_store.put(key, value, expires_at)
+            except sqlite3.Error as e:
+                print(f"Shared classifier cache write failed: {e}")
+
+    def get_or_compute(self, assistant_id, text, compute, role=''):
+        value = self.get(assistant_id, text, role)
+        if value is MISS:
+            value = compute()
+            self.put(assistant_id, text, value)
+        return value
+
+    async def get_or_compute_async(self, assistant_id, text, compute, role=''):
+        # get_or_compute for callers on an event loop; compute() returns an awaitable
+        value = self.get(assistant_id, text, role)
+        if value is MISS:
+            value = await compute()
+            self.put(assistant_id, text, value)
+        return value
+
+    def hit_rate(self, role=''):
+        hits = cache_lookups.value(role=role, result='hit') + cache_lookups.value(role=role, result='shared_hit')
+        total = hits + cache_lookups.value(role=role, result='miss')
+        return hits / total if total else 0.0
+
+    def metric_lines(self):
+        # Hit rate per role as a gauge, alongside the raw lookup counter
+        roles = sorted({labels.get('role', '') for labels in cache_lookups.labelsets()})
+        lines = [
+            "# HELP converso_classifier_cache_hit_rate Share of classifier lookups answered from the cache, by role.",
+            "# TYPE converso_classifier_cache_hit_rate gauge",
+        ]
+        lines.extend(f'converso_classifier_cache_hit_rate{{role="{role}"}} {self.hit_rate(role)}' for role in roles)
+        with self._lock:
+            size = len(self._entries)
+        lines.extend([
+            "# HELP converso_classifier_cache_entries Classifier results held in this worker's cache.",
+            "# TYPE converso_classifier_cache_entries gauge",
+            f"converso_classifier_cache_entries {size}",
+        ])
+        return lines
+
+    def _remember(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
@@ -0,0 +1,96 @@
+# Conversation history budgets, in tokens, by the learner's CEFR level. Beginners
+# get short windows; advanced learners hold longer exchanges in view.
+DEFAULT_TOKEN_BUDGETS = {"A1": 1000, "A2": 1200, "B1": 1600, "B2": 2000, "C1": 2500, "C2": 3000}
+DEFAULT_SUMMARY_BUDGET = 250
+
+# Roughly what the chat models charge per message on top of its text
+MESSAGE_OVERHEAD_TOKENS = 4
+SUMMARY_LINE_CHARS = 120
+
+
+def estimate_tokens(text):
+    # About four characters per token for the languages we teach; good enough for budgeting
+    return len(text) // 4 + 1 if text else 0
+
+
+def message_tokens(message):
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def parse_token_budgets(value):
+    # "A1=800,B2=2400" -> defaults with those levels overridden
+    budgets = dict(DEFAULT_TOKEN_BUDGETS)
+    for item in filter(None, (part.strip() for part in (value or "").split(","))):
+        level, _, tokens = item.partition("=")
+        budgets[level.strip().upper()] = int(tokens)
+    return budgets
+
+
+class ConversationContext:
+    # Holds the recent turns that fit the level's token budget and folds anything
+    # older into a short rolling summary, so the context sent per turn stays flat
+    # however long the conversation runs.
+    def __init__(self, budgets=None, summary_budget=DEFAULT_SUMMARY_BUDGET):
+        self.budgets = budgets or dict(DEFAULT_TOKEN_BUDGETS)
+        self.summary_budget = summary_budget
+        self.reset()
+
+    def reset(self):
+        self.messages = []
+        self.summary_lines = []
+        self.last_turn_tokens = 0
+        self.total_tokens_sent = 0
+        self.turns = 0
+
+    @property
+    def summary(self):
+        return " ".join(self.summary_lines)
+
+    def to_state(self):
+        return {"messages": list(self.messages), "summary_lines": list(self.summary_lines)}
+
+    def load_state(self, state):
+        self.messages = list(state.get("messages", []))
+        self.summary_lines = list(state.get("summary_lines", []))
+
+    def append(self, role, content):
+        self.messages.append({"role": role, "content": content})
+
+    def retract(self, role, content):
+        # Takes back the newest message, e.g. a learner message whose reply never came
+        if self.messages and self.messages[-1] == {"role": role, "content": content}:
+            self.messages.pop()
+            return True
+        return False
+
+    def build(self, cefr_level, instructions=""):
+        # Returns the messages to keep in view and the summary of everything before them
+        budget = self.budgets.get(cefr_level, DEFAULT_TOKEN_BUDGETS["B1"])
+        used = 0
+        start = len(self.messages)
+        while start > 0:
+            tokens = message_tokens(self.messages[start - 1])
+            # Always keep the newest message, even if it alone is over budget
+            if used + tokens > budget and start < len(self.messages):
+                break
+            used += tokens
+            start -= 1
+
+        if start:
+            self._fold(self.messages[:start])
+            self.messages = self.messages[start:]
+
+        summary = self.summary
+        self.last_turn_tokens = used + estimate_tokens(summary) + estimate_tokens(instructions)
+        self.total_tokens_sent += self.last_turn_tokens
+        self.turns += 1
+        return list(self.messages), summary
+
+    def _fold(self, messages):
+        for message in messages:
+            text = " ".join(message["content"].split())
+            if len(text) > SUMMARY_LINE_CHARS:
+                text = text[:SUMMARY_LINE_CHARS].rsplit(" ", 1)[0] + "..."
+            self.summary_lines.append(f"{message['role']}: {text}")
+        while self.summary_lines and estimate_tokens(self.summary) > self.summary_budget:
+            self.summary_lines.pop(0)
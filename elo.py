@@ -0,0 +1,126 @@
+import argparse
+import time
+
+import numpy as np
+
+# Rating model shared by the server and the calibration simulator. Everything
+# takes scalars or arrays, so the online path rates one learner per call and
+# the simulator rates millions per call with the same code.
+
+CEFR_LEVELS = np.array(["A1", "A2", "B1", "B2", "C1", "C2"])
+# Highest rating in each level; ratings above the last one or below 0 are "Unknown"
+CEFR_UPPER_BOUNDS = np.array([333, 666, 1000, 1333, 1666, 2000])
+MAX_RATING = 2000
+
+DEFAULT_K = 5
+DEFAULT_SPREAD = 400
+ELO_SCALE = 400
+
+
+def sample_difficulty(ratings, spread=DEFAULT_SPREAD, rng=np.random):
+    # Bot difficulty drawn around the learner's rating, truncated to whole points
+    difficulty = np.trunc(rng.normal(ratings, spread)).astype(np.int64)
+    return np.clip(difficulty, 0, MAX_RATING)
+
+
+def cefr_levels(ratings):
+    ratings = np.asarray(ratings)
+    index = np.searchsorted(CEFR_UPPER_BOUNDS, ratings, side='left')
+    known = (ratings >= 0) & (index < len(CEFR_LEVELS))
+    return np.where(known, CEFR_LEVELS[np.minimum(index, len(CEFR_LEVELS) - 1)], "Unknown")
+
+
+def expected_score(ratings, difficulty):
+    return 1 / (1 + 10 ** ((np.asarray(difficulty) - np.asarray(ratings)) / ELO_SCALE))
+
+
+def rating_change(ratings, performance, difficulty, k=DEFAULT_K):
+    return k * (np.asarray(performance) - expected_score(ratings, difficulty))
+
+
+def update_ratings(ratings, performance, difficulty, k=DEFAULT_K):
+    # New whole-point ratings, floored at 0
+    new_ratings = np.asarray(ratings) + rating_change(ratings, performance, difficulty, k)
+    return np.trunc(np.maximum(new_ratings, 0)).astype(np.int64)
+
+
+def simulate(true_ratings, start_rating=300, turns=50, k=DEFAULT_K, spread=DEFAULT_SPREAD, score_noise=0.15,
+             vocab_bonus=0.0, english_penalty=0.0, tolerance=100, checkpoints=(1, 5, 10, 25, 50, 100), rng=None):
+    # Plays `turns` turns for every learner at once. A learner's response score is
+    # the Elo expectation at their true rating plus noise, combined with the vocab
+    # bonus and English penalty the way calculate_overall_performance_score does.
+    rng = rng or np.random.default_rng()
+    true_ratings = np.asarray(true_ratings)
+    ratings = np.full(true_ratings.shape, start_rating, dtype=np.int64)
+    first_converged = np.full(true_ratings.shape, -1, dtype=np.int64)
+    true_levels = cefr_levels(true_ratings)
+    history = []
+
+    for turn in range(1, turns + 1):
+        difficulty = sample_difficulty(ratings, spread, rng)
+        response_score = np.clip(expected_score(true_ratings, difficulty) + rng.normal(0, score_noise, ratings.shape), 0, 1)
+        ratings = update_ratings(ratings, response_score + vocab_bonus - english_penalty, difficulty, k)
+
+        error = np.abs(ratings - true_ratings)
+        first_converged[(first_converged < 0) & (error <= tolerance)] = turn
+        if turn in checkpoints or turn == turns:
+            history.append({
+                'turn': turn,
+                'mean_abs_error': float(error.mean()),
+                'p90_abs_error': float(np.percentile(error, 90)),
+                'level_accuracy': float(np.mean(cefr_levels(ratings) == true_levels)),
+            })
+
+    converged = first_converged[first_converged > 0]
+    return {
+        'ratings': ratings,
+        'history': history,
+        'converged_share': float(converged.size / max(ratings.size, 1)),
+        'median_turns_to_converge': float(np.median(converged)) if converged.size else None,
+        'level_distribution': level_distribution(ratings),
+        'true_level_distribution': level_distribution(true_ratings),
+    }
+
+
+def level_distribution(ratings):
+    levels, counts = np.unique(cefr_levels(ratings), return_counts=True)
+    return {str(level): float(count / counts.sum()) for level, count in zip(levels, counts)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate synthetic learners through the Elo rating model.')
+    parser.add_argument('--learners', type=int, default=100000)
+    parser.add_argument('--turns', type=int, default=50)
+    parser.add_argument('--start-rating', type=int, default=300, help='Rating every learner starts at (the server default is 300).')
+    parser.add_argument('--k', type=float, default=DEFAULT_K)
+    parser.add_argument('--spread', type=float, default=DEFAULT_SPREAD, help='Std dev of the bot difficulty around the rating.')
+    parser.add_argument('--score-noise', type=float, default=0.15, help='Std dev of the response score around its expectation.')
+    parser.add_argument('--vocab-bonus', type=float, default=0.0)
+    parser.add_argument('--english-penalty', type=float, default=0.0)
+    parser.add_argument('--tolerance', type=float, default=100, help='Error in points that counts as converged.')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    true_ratings = rng.integers(0, MAX_RATING + 1, args.learners)
+    started = time.perf_counter()
+    result = simulate(true_ratings, args.start_rating, args.turns, args.k, args.spread, args.score_noise,
+                      args.vocab_bonus, args.english_penalty, args.tolerance, rng=rng)
+    elapsed = time.perf_counter() - started
+
+    print(f"{args.learners} learners x {args.turns} turns in {elapsed:.2f}s (k={args.k}, spread={args.spread})")
+    print(f"  {'turn':>6}{'mean err':>10}{'p90 err':>10}{'level acc':>11}")
+    for row in result['history']:
+        print(f"  {row['turn']:>6}{row['mean_abs_error']:>10.0f}{row['p90_abs_error']:>10.0f}{row['level_accuracy']:>11.1%}")
+    median_turns = result['median_turns_to_converge']
+    print(f"Within {args.tolerance:.0f} points at least once: {result['converged_share']:.1%}"
+          + (f", median turn {median_turns:.0f}" if median_turns is not None else ""))
+    print(f"  {'level':>8}{'simulated':>11}{'true':>8}")
+    for level in list(CEFR_LEVELS) + ["Unknown"]:
+        simulated, true = result['level_distribution'].get(level, 0), result['true_level_distribution'].get(level, 0)
+        if simulated or true:
+            print(f"  {level:>8}{simulated:>11.1%}{true:>8.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+import asyncio
+import json
+import time
+
+from event_handlers import AsyncEventHandler, DeltaBuffer, EventHandler
+from metrics import record_usage
+from openai_clients import async_endpoint_limit, endpoint_limit
+from run_executor import RunDeadlineExceeded
+
+# Roles an engine can be chosen for, e.g. ENGINE_TUTOR=chat ENGINE_RESPONSE_SCORE=chat
+ENGINE_ROLES = ('tutor', 'help_detector', 'response_score', 'english_word_counter')
+
+# Replaces the classifier assistants' stored instructions when they run as chat completions
+CLASSIFIER_PROMPTS = {
+    'help_detector': (
+        "You read one message a language learner sent to their tutor. Decide whether the learner is asking "
+        "the tutor for help: asking what something means, how to say something, for a translation or an "
+        "explanation, or saying they do not understand. Answer 'yes' or 'no'."
+    ),
+    'response_score': (
+        "You grade a language learner's reply in a tutoring conversation. The input is the tutor's message "
+        "after 'bot:' and the learner's reply after 'user:'. Give an overall score from 0 to 1 for how well "
+        "the reply answers the tutor's message, weighing relevance, grammar and vocabulary equally."
+    ),
+    'english_word_counter': (
+        "You read a message a language learner wrote in the language they are learning. Count the English "
+        "words in it. Names, cognates spelled the same in both languages and numbers are not English words."
+    ),
+}
+
+# Structured output schemas, named after the role so replies can be told apart in logs and stubs
+CLASSIFIER_SCHEMAS = {
+    'help_detector': {
+        'type': 'object',
+        'properties': {'user_asking_for_help': {'type': 'string', 'enum': ['yes', 'no']}},
+        'required': ['user_asking_for_help'],
+        'additionalProperties': False,
+    },
+    'response_score': {
+        'type': 'object',
+        'properties': {'Overall Score': {'type': 'number'}},
+        'required': ['Overall Score'],
+        'additionalProperties': False,
+    },
+    'english_word_counter': {
+        'type': 'object',
+        'properties': {'number_of_english_words': {'type': 'integer'}},
+        'required': ['number_of_english_words'],
+        'additionalProperties': False,
+    },
+}
+
+
+class CompletionBuffer(DeltaBuffer):
+    # Collects a streamed chat completion the way the event handlers collect a run
+    def __init__(self, sinks=None):
+        self._init_buffer(sinks)
+        self.usage = None
+
+    def add_chunk(self, chunk):
+        if chunk.usage is not None:
+            self.usage = chunk.usage
+        for choice in chunk.choices:
+            self._add_delta(choice.delta.content)
+
+
+class AssistantsEngine:
+    # Runs on the chat's Assistants threads, through run_executor
+    name = 'assistants'
+    # The tutor assistant looks the level's vocabulary files up itself
+    uses_file_search = True
+
+    def __init__(self, run_executor):
+        self.run_executor = run_executor
+
+    def cache_key(self, chat, role):
+        return getattr(chat, f"{role}_assistant").id
+
+    def tutor_vocabulary(self, chat, level_data):
+        return level_data.vocabulary_str
+
+    def reply(self, chat, turn, sinks=None):
+        handler = self.run_executor.stream(
+            'tutor',
+            make_handler=lambda: EventHandler(sinks=sinks),
+            **chat.tutor_run_params(turn),
+        )
+        record_usage('tutor', getattr(handler.current_run, 'usage', None))
+        return handler
+
+    async def reply_async(self, chat, turn, sinks=None):
+        # Thread creation on first use still goes through the sync client, so keep it off the loop
+        await asyncio.to_thread(lambda: chat.thread)
+        handler = await self.run_executor.stream_async(
+            chat.async_client,
+            'tutor',
+            make_handler=lambda: AsyncEventHandler(sinks=sinks),
+            **chat.tutor_run_params(turn),
+        )
+        record_usage('tutor', getattr(handler.current_run, 'usage', None))
+        return handler
+
+    def classify(self, chat, role, content):
+        handler = self.run_executor.stream(
+            role,
+            thread_id=chat._get_thread(f"{role}_thread").id,
+            make_handler=EventHandler,
+            assistant_id=getattr(chat, f"{role}_assistant").id,
+            additional_messages=[{"role": "user", "content": content}],
+        )
+        record_usage(role, getattr(handler.current_run, 'usage', None))
+        return json.loads(handler.current_response)
+
+    async def classify_async(self, chat, role, content):
+        thread = await asyncio.to_thread(chat._get_thread, f"{role}_thread")
+        handler = await self.run_executor.stream_async(
+            chat.async_client,
+            role,
+            thread_id=thread.id,
+            make_handler=AsyncEventHandler,
+            assistant_id=getattr(chat, f"{role}_assistant").id,
+            additional_messages=[{"role": "user", "content": content}],
+        )
+        record_usage(role, getattr(handler.current_run, 'usage', None))
+        return json.loads(handler.current_response)
+
+
+class ChatCompletionsEngine:
+    # Calls chat.completions directly: no threads, runs or queueing. The
+    # conversation comes from the chat's own ConversationContext, the level's
+    # vocabulary is written into the system prompt instead of found with
+    # file_search, and classifier roles answer with JSON-schema output.
+    name = 'chat'
+    uses_file_search = False
+
+    def __init__(self, run_executor, vocabulary_index, model='gpt-4o-mini', vocabulary_words=400):
+        self.run_executor = run_executor
+        self.vocabulary_index = vocabulary_index
+        self.model = model
+        self.vocabulary_words = vocabulary_words
+
+    def cache_key(self, chat, role):
+        return f"chat:{self.model}:{role}"
+
+    def tutor_vocabulary(self, chat, level_data):
+        # Stands in for the vocabulary file names in the tutor prompt
+        words = self.vocabulary_index.level_words(chat.language, chat.cefr_level)[:self.vocabulary_words]
+        return f"this list of {chat.cefr_level} words: {', '.join(words)}" if words else f"the {chat.cefr_level} level"
+
+    def tutor_messages(self, chat, turn):
+        # The instructions were built for this engine: inline vocabulary, no file_search steps
+        system = turn['instructions']
+        if turn['additional_instructions'].strip():
+            system += "\n" + turn['additional_instructions'].strip()
+        # The window already ends with the learner's new message
+        return [{"role": "system", "content": system}] + turn['window']
+
+    def classifier_request(self, role, content):
+        return {
+            'model': self.model,
+            'messages': [{"role": "system", "content": CLASSIFIER_PROMPTS[role]}, {"role": "user", "content": content}],
+            'response_format': {'type': 'json_schema', 'json_schema': {'name': role, 'schema': CLASSIFIER_SCHEMAS[role], 'strict': True}},
+            'temperature': 0,
+        }
+
+    def reply(self, chat, turn, sinks=None):
+        messages = self.tutor_messages(chat, turn)
+        buffers = []
+
+        def attempt(timeout):
+            buffer = CompletionBuffer(sinks)
+            buffers.append(buffer)
+            deadline = time.monotonic() + timeout
+            with endpoint_limit('chat'):
+                stream = chat.client.with_options(max_retries=0, timeout=timeout).chat.completions.create(
+                    model=self.model, messages=messages, stream=True, stream_options={'include_usage': True},
+                )
+                with stream:
+                    for chunk in stream:
+                        buffer.add_chunk(chunk)
+                        if time.monotonic() > deadline:
+                            raise RunDeadlineExceeded("tutor completion missed its deadline")
+            return buffer
+
+        # Never retried once text has reached the learner
+        buffer = self.run_executor.call('tutor', attempt, can_retry=lambda error: buffers[-1].first_token_at is None)
+        record_usage('tutor', buffer.usage)
+        return buffer
+
+    async def reply_async(self, chat, turn, sinks=None):
+        messages = self.tutor_messages(chat, turn)
+        buffers = []
+
+        async def attempt(timeout):
+            buffer = CompletionBuffer(sinks)
+            buffers.append(buffer)
+            async with async_endpoint_limit('chat'):
+                stream = await chat.async_client.with_options(max_retries=0, timeout=timeout).chat.completions.create(
+                    model=self.model, messages=messages, stream=True, stream_options={'include_usage': True},
+                )
+                async with asyncio.timeout(timeout), stream:
+                    async for chunk in stream:
+                        buffer.add_chunk(chunk)
+            return buffer
+
+        try:
+            buffer = await self.run_executor.call_async('tutor', attempt, can_retry=lambda error: buffers[-1].first_token_at is None)
+        except TimeoutError as e:
+            raise RunDeadlineExceeded("tutor completion missed its deadline") from e
+        record_usage('tutor', buffer.usage)
+        return buffer
+
+    def classify(self, chat, role, content):
+        request = self.classifier_request(role, content)
+
+        def attempt(timeout):
+            with endpoint_limit('chat'):
+                return chat.client.with_options(max_retries=0, timeout=timeout).chat.completions.create(**request)
+
+        completion = self.run_executor.call(role, attempt)
+        record_usage(role, completion.usage)
+        return json.loads(completion.choices[0].message.content)
+
+    async def classify_async(self, chat, role, content):
+        request = self.classifier_request(role, content)
+
+        async def attempt(timeout):
+            async with async_endpoint_limit('chat'):
+                return await chat.async_client.with_options(max_retries=0, timeout=timeout).chat.completions.create(**request)
+
+        completion = await self.run_executor.call_async(role, attempt)
+        record_usage(role, completion.usage)
+        return json.loads(completion.choices[0].message.content)
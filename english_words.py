@@ -0,0 +1,36 @@
+import re
+
+WORD_PATTERN = re.compile(r'\b\w+\b')
+
+
+def tokenize(message):
+    return WORD_PATTERN.findall(message.lower())
+
+
+class EnglishWordDetector:
+    # Counts English words in learner messages locally. A word counts as English
+    # when it is in the English lexicon and in none of the target language's
+    # lexicons, so cognates and shared words ('hotel', 'no', 'animal') are not
+    # penalised. english_lexicon() returns the English word container and
+    # target_lexicons(language) returns the target language's; both support `in`.
+    def __init__(self, english_lexicon, target_lexicons):
+        self.english_lexicon = english_lexicon
+        self.target_lexicons = target_lexicons
+
+    def is_english(self, word, english, lexicons):
+        if not word.isalpha() or not word.isascii():
+            return False
+        if word not in english:
+            return False
+        return not any(word in lexicon for lexicon in lexicons)
+
+    def english_words(self, words, language):
+        english = self.english_lexicon()
+        lexicons = self.target_lexicons(language)
+        return [word for word in words if self.is_english(word, english, lexicons)]
+
+    def count(self, messages, language):
+        # Batched form: one count per message, sharing the lexicon lookup for the language
+        english = self.english_lexicon()
+        lexicons = self.target_lexicons(language)
+        return [sum(1 for word in tokenize(message) if self.is_english(word, english, lexicons)) for message in messages]
@@ -0,0 +1,100 @@
+import logging
+import os
+import time
+
+from openai import AssistantEventHandler, AsyncAssistantEventHandler
+from typing_extensions import override
+
+stream_logger = logging.getLogger('converso.stream')
+
+
+def console_sink(text):
+    print(text, end="", flush=False)
+
+
+def log_sink(text):
+    stream_logger.debug(text)
+
+
+# Sinks every handler gets on top of its own, e.g. STREAM_SINKS=console while debugging.
+# Empty by default so replies are never written to stdout.
+SINKS_BY_NAME = {'console': console_sink, 'log': log_sink}
+DEFAULT_SINKS = [SINKS_BY_NAME[name] for name in filter(None, os.getenv('STREAM_SINKS', '').split(','))]
+
+
+class DeltaBuffer:
+    # Shared by the sync and async handlers: text deltas are appended to a list
+    # (joined once, when the response is read) and handed to each sink in turn.
+    def _init_buffer(self, sinks):
+        self._chunks = []
+        self._response = None
+        self.sinks = list(sinks or []) + DEFAULT_SINKS
+        self.started_at = time.perf_counter()
+        self.first_token_at = None
+        self.last_token_at = None
+
+    def _add_delta(self, text):
+        if not text:
+            return
+        now = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        self.last_token_at = now
+        self._chunks.append(text)
+        self._response = None
+        for sink in self.sinks:
+            sink(text)
+
+    @property
+    def current_response(self):
+        if self._response is None:
+            self._response = "".join(self._chunks)
+        return self._response
+
+    def time_to_first_token(self):
+        return None if self.first_token_at is None else self.first_token_at - self.started_at
+
+    def _log_tool_call(self, delta):
+        if delta.type == 'code_interpreter' and stream_logger.isEnabledFor(logging.DEBUG):
+            if delta.code_interpreter.input:
+                stream_logger.debug(delta.code_interpreter.input)
+            for output in delta.code_interpreter.outputs or []:
+                if output.type == "logs":
+                    stream_logger.debug(output.logs)
+
+
+class EventHandler(DeltaBuffer, AssistantEventHandler):
+    # sinks: callables given each text delta, e.g. to stream it to the client
+    def __init__(self, sinks=None):
+        super().__init__()
+        self._init_buffer(sinks)
+
+    @override
+    def on_text_delta(self, delta, snapshot):
+        self._add_delta(delta.value)
+
+    @override
+    def on_tool_call_created(self, tool_call):
+        stream_logger.debug("assistant > %s", tool_call.type)
+
+    @override
+    def on_tool_call_delta(self, delta, snapshot):
+        self._log_tool_call(delta)
+
+
+class AsyncEventHandler(DeltaBuffer, AsyncAssistantEventHandler):
+    def __init__(self, sinks=None):
+        super().__init__()
+        self._init_buffer(sinks)
+
+    @override
+    async def on_text_delta(self, delta, snapshot):
+        self._add_delta(delta.value)
+
+    @override
+    async def on_tool_call_created(self, tool_call):
+        stream_logger.debug("assistant > %s", tool_call.type)
+
+    @override
+    async def on_tool_call_delta(self, delta, snapshot):
+        self._log_tool_call(delta)
@@ -0,0 +1,139 @@
+import re
+import threading
+
+import numpy as np
+
+# Phrases that only show up when the learner is asking the tutor for help. Words
+# that also turn up in ordinary sentences ("me ayuda con la tarea", "no se levanta",
+# "non ho capito il film") only count in their request forms.
+HELP_PATTERNS = re.compile(
+    # "help" on its own, as a request, or in a question
+    r"^\W*(help|ayuda|hilfe|aiuto|помогите|помоги)\W*$|\bhelp me\b|\bi need (some |your )?help\b|"
+    r"\b(can|could|would) you (please )?help\b|\bhelp\b[^.!]*\?\s*$|"
+    r"\bay[uú]dame\b|\bnecesito (tu )?ayuda\b|\b(me )?puedes ayudar|\bayuda\b[^.!]*\?\s*$|"
+    r"\bhilf mir\b|\bich brauche (deine )?hilfe\b|\baiutami\b|\bho bisogno di aiuto\b|\bпомоги(те)? мне\b|"
+    r"how (do|would|can) (you|i) say|what does .+ mean|what do you mean|\bmeaning of\b|"
+    r"\btranslat(e|ion)\b|\bin english\s*\?|\b(say|said|mean|means|write) (it |that |this )?in english\b|"
+    r"i (don'?t|do not) (understand|know|get)|i'?m (confused|lost)|can you (explain|repeat|say that again)|"
+    r"what is .+ in (english|spanish|german|italian|russian|mandarin|chinese)\s*\??\s*$|"
+    # "no sé" only on its own ("no sé.", "no sé cómo..."); "no se levanta" and "no sé nada" are conversation
+    r"\bno (entiendo|comprendo)\b|\bno s[eé] (qu[eé]|c[oó]mo)\b|\bno sé\s*([.!?,…]|$)|"
+    r"qu[eé] significa|c[oó]mo se dice|ich verstehe (das )?nicht|"
+    r"\bnon capisco\b|\bnon ho capito\s*([.!?,…]|$)|\bnon ho capito (cosa|che cosa|quello)\b|"
+    r"я не понимаю|不懂|不明白|什么意思|怎么说",
+    re.IGNORECASE,
+)
+
+# Seed examples for the nearest-centroid model on word vectors
+HELP_EXAMPLES = [
+    "I need help",
+    "what does that word mean",
+    "how do I say this",
+    "can you explain that to me",
+    "I am confused about the grammar",
+    "why is it like that",
+    "what is the difference between these two words",
+    "sorry I do not understand what you said",
+]
+CHAT_EXAMPLES = [
+    "I like to play soccer with my friends",
+    "yesterday I went to the beach",
+    "my favorite food is pizza",
+    "the weather is nice today",
+    "I have two dogs and a cat",
+    "I work in an office downtown",
+    "we are going to travel next summer",
+    "I listen to music every day",
+]
+
+
+class HelpClassifier:
+    # Decides the obvious cases of "is the learner asking for help" locally and
+    # returns None for the rest, which the caller escalates to the help detector
+    # assistant. english_word_count(message, language) and vectorize(text) are
+    # supplied by the server so this module stays free of heavy imports.
+    def __init__(self, english_word_count, vectorize, margin=0.08):
+        self.english_word_count = english_word_count
+        self.vectorize = vectorize
+        self.margin = margin
+        self._centroids = None
+        self._lock = threading.Lock()
+        self.counts = {'pattern_yes': 0, 'target_language_no': 0, 'vector_yes': 0, 'vector_no': 0, 'escalated': 0}
+
+    def classify(self, message, language):
+        if HELP_PATTERNS.search(message):
+            return self._decide('pattern_yes', 'yes')
+
+        # A message written entirely in the target language is the learner just
+        # carrying on the conversation; the word vectors are English, so they only
+        # get a say when the message has English in it
+        if self.english_word_count(message, language) == 0:
+            return self._decide('target_language_no', 'no')
+
+        similarity = self._help_similarity(message)
+        if similarity is not None:
+            if similarity >= self.margin:
+                return self._decide('vector_yes', 'yes')
+            if similarity <= -self.margin:
+                return self._decide('vector_no', 'no')
+        self._count('escalated')
+        return None
+
+    def escalation_rate(self):
+        with self._lock:
+            total = sum(self.counts.values())
+            return self.counts['escalated'] / total if total else 0.0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counts)
+        stats['escalation_rate'] = self.escalation_rate()
+        return stats
+
+    def metric_lines(self):
+        # Prometheus exposition of the decision counts, for the /metrics route
+        stats = self.stats()
+        lines = [
+            "# HELP converso_help_classifier_decisions_total Help classifier outcomes by reason.",
+            "# TYPE converso_help_classifier_decisions_total counter",
+        ]
+        escalation_rate = stats.pop('escalation_rate')
+        lines.extend(f'converso_help_classifier_decisions_total{{reason="{reason}"}} {count}' for reason, count in stats.items())
+        lines.extend([
+            "# HELP converso_help_classifier_escalation_rate Share of messages sent on to the help detector assistant.",
+            "# TYPE converso_help_classifier_escalation_rate gauge",
+            f"converso_help_classifier_escalation_rate {escalation_rate}",
+        ])
+        return lines
+
+    def _help_similarity(self, message):
+        # Cosine similarity to the help centroid minus similarity to the chat centroid
+        vector = self._vector(message)
+        if vector is None:
+            return None
+        help_centroid, chat_centroid = self._get_centroids()
+        return float(vector @ help_centroid - vector @ chat_centroid)
+
+    def _vector(self, text):
+        vector = np.asarray(self.vectorize(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return None
+        return vector / norm
+
+    def _get_centroids(self):
+        if self._centroids is None:
+            centroids = []
+            for examples in (HELP_EXAMPLES, CHAT_EXAMPLES):
+                centroid = np.mean([self._vector(example) for example in examples], axis=0)
+                centroids.append(centroid / np.linalg.norm(centroid))
+            self._centroids = tuple(centroids)
+        return self._centroids
+
+    def _decide(self, reason, answer):
+        self._count(reason)
+        return answer
+
+    def _count(self, reason):
+        with self._lock:
+            self.counts[reason] += 1
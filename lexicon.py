@@ -0,0 +1,106 @@
+import fcntl
+import mmap
+import os
+import struct
+
+# On-disk sorted string table:
+#   b'LEX1' | uint32 count | uint32 offsets[count + 1] | UTF-8 words, sorted bytewise
+# Word i is blob[offsets[i]:offsets[i + 1]], with offsets relative to the blob start.
+MAGIC = b'LEX1'
+HEADER = struct.Struct('<4sI')
+
+
+def build_lexicon(words, path):
+    encoded = sorted({word.encode('utf-8') for word in words if word})
+    offsets = [0]
+    for word in encoded:
+        offsets.append(offsets[-1] + len(word))
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, len(encoded)))
+        file.write(struct.pack(f'<{len(offsets)}I', *offsets))
+        file.write(b''.join(encoded))
+    # Readers only ever see a complete file
+    os.replace(tmp_path, path)
+    return len(encoded)
+
+
+def open_lexicon(path, build_words):
+    # Maps the lexicon at path, building it from build_words() first if it does not
+    # exist yet. The build is done by exactly one process; the rest wait and map it.
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(f"{path}.lock", 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if not os.path.exists(path):
+                    count = build_lexicon(build_words(), path)
+                    print(f"Built lexicon {path} with {count} words")
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    return MappedLexicon(path)
+
+
+class MappedLexicon:
+    # Read-only view over a lexicon file. The pages are shared by every process
+    # that maps the same file, so each worker adds almost nothing to its RSS.
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            self._mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a lexicon file")
+        offsets_end = HEADER.size + 4 * (self._count + 1)
+        self._offsets = memoryview(self._mm)[HEADER.size:offsets_end].cast('I')
+        self._blob_start = offsets_end
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, word):
+        key = word.encode('utf-8')
+        index = self._lower_bound(key)
+        return index < self._count and self._key(index) == key
+
+    def prefix(self, prefix, limit=None):
+        key = prefix.encode('utf-8')
+        words = []
+        index = self._lower_bound(key)
+        while index < self._count and (limit is None or len(words) < limit):
+            word = self._key(index)
+            if not word.startswith(key):
+                break
+            words.append(word.decode('utf-8'))
+            index += 1
+        return words
+
+    def unknown(self, words):
+        # Same contract as SpellChecker.unknown: lower-cased words not in the dictionary
+        return {word for word in (w.lower() for w in words) if not _is_number(word) and word not in self}
+
+    def close(self):
+        self._offsets.release()
+        self._mm.close()
+
+    def _key(self, index):
+        start = self._blob_start + self._offsets[index]
+        return self._mm[start:self._blob_start + self._offsets[index + 1]]
+
+    def _lower_bound(self, key):
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+
+def _is_number(word):
+    try:
+        float(word)
+    except ValueError:
+        return False
+    return True
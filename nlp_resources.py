@@ -0,0 +1,101 @@
+import os
+import threading
+
+from lexicon import open_lexicon
+
+# Names accepted by set_language -> codes used by the spell dictionaries
+LANGUAGE_CODES = {
+    'spanish': 'es',
+    'german': 'de',
+    'italian': 'it',
+    'russian': 'ru',
+    'mandarin': 'zh',
+    'english': 'en',
+}
+
+# Built lexicon files live here and are memory-mapped by every worker
+LEXICON_DIR = os.getenv('LEXICON_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lexicons'))
+
+# Languages pyspellchecker ships a dictionary for
+SPELL_CHECK_LANGUAGES = {'en', 'es', 'fr', 'it', 'pt', 'de', 'ru', 'ar', 'eu', 'lv', 'nl', 'fa'}
+
+
+def language_code(language):
+    language = (language or 'spanish').lower()
+    return LANGUAGE_CODES.get(language, language)
+
+
+class NLPResources:
+    # Process-wide home for the heavy NLP objects. spaCy is loaded the first time
+    # it is asked for, or ahead of time by warm_up(), and then shared by every
+    # session in the process. Word lists used for membership checks, including
+    # each language's spell-check dictionary, are memory-mapped lexicon files, so
+    # their pages are shared across worker processes as well.
+    def __init__(self, spacy_model='en_core_web_md'):
+        self.spacy_model = spacy_model
+        self._resources = {}
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        self._ready = threading.Event()
+        self.warm_up_error = None
+
+    def nlp(self):
+        def load():
+            import spacy
+            return spacy.load(self.spacy_model)
+        return self._get('nlp', load)
+
+    def english_lexicon(self):
+        # spaCy's vocabulary strings as a mapped lexicon; only the process that finds the file missing builds it
+        path = os.path.join(LEXICON_DIR, f"english_{self.spacy_model}.lex")
+        return self._get('english_lexicon', lambda: open_lexicon(path, lambda: self.nlp().vocab.strings))
+
+    def spell_lexicon(self, language_code):
+        # The spell checker's dictionary as a mapped lexicon; None when there is no dictionary (e.g. Mandarin)
+        if language_code not in SPELL_CHECK_LANGUAGES:
+            return None
+        path = os.path.join(LEXICON_DIR, f"spell_{language_code}.lex")
+        return self._get(('spell_lexicon', language_code), lambda: open_lexicon(path, lambda: self._spell_words(language_code)))
+
+    def warm_up(self, language_codes, background=True):
+        if background:
+            threading.Thread(target=self.warm_up, args=(language_codes, False), name='nlp-warm-up', daemon=True).start()
+            return
+        try:
+            # The help classifier needs spaCy's vectors on the request path, so load it up front
+            self.nlp()
+            self.english_lexicon()
+            for language_code in language_codes:
+                self.spell_lexicon(language_code)
+            self._ready.set()
+            print("NLP resources are warm")
+        except Exception as e:
+            self.warm_up_error = str(e)
+            print(f"NLP warm-up failed: {e}")
+
+    def is_ready(self):
+        return self._ready.is_set()
+
+    def loaded(self):
+        return sorted(key if isinstance(key, str) else "/".join(key) for key in self._resources)
+
+    def _spell_words(self, language_code):
+        from spellchecker import SpellChecker
+        return list(SpellChecker(language=language_code).word_frequency.keys())
+
+    def _get(self, key, load):
+        resource = self._resources.get(key)
+        if resource is not None:
+            return resource
+        # Only the first caller loads; everyone else asking for the same key waits for it
+        with self._key_lock(key):
+            resource = self._resources.get(key)
+            if resource is None:
+                print(f"Loading {key}")
+                resource = load()
+                self._resources[key] = resource
+        return resource
+
+    def _key_lock(self, key):
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
@@ -3,7 +3,7 @@ from flask_cors import CORS
 import requests
 import json
 import os
-from openai import OpenAI
+from openai_clients import endpoint_limit, get_client
 
 app = Flask(__name__)
 CORS(app)  # This is necessary to handle CORS if your Flutter app and this backend are on different domains.
@@ -36,17 +36,18 @@ def ask():
   
 
     
-    client = OpenAI(api_key=api_key)
-
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-       
-        
-        messages=messages_list
-        ,
-        
-        max_tokens=150
-    )
+    client = get_client(api_key)
+
+    with endpoint_limit('chat'):
+        response = client.chat.completions.create(
+            model="gpt-3.5-turbo",
+           
+            
+            messages=messages_list
+            ,
+            
+            max_tokens=150
+        )
 
     print(response.choices[0].message.content)
 
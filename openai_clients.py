@@ -0,0 +1,106 @@
+import asyncio
+import os
+import threading
+from contextlib import asynccontextmanager, contextmanager
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+
+ASSISTANT_IDS = {
+    'tutor': "asst_XDSA4hq7fq8fd0pdtAb0iUTG",
+    'advanced_word_detector': "asst_gZ5kpgBJaPbWcKz3YrWgmtUk",
+    'english_word_counter': "asst_QHN8ywHLkU7wLp10G7dgENtT",
+    'response_score': "asst_HH1NiwYkrgXKoUrNI1sPEQoL",
+    'help_detector': "asst_qPLbwpxRHY7dnM9G9fewViQk",
+    'mistake_detector': "asst_NKpMtClPEqj8xHlQ46LM9304",
+}
+
+# Connection pool shared by every call this process makes to the API
+MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', 200))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('OPENAI_MAX_KEEPALIVE_CONNECTIONS', 100))
+KEEPALIVE_EXPIRY = float(os.getenv('OPENAI_KEEPALIVE_EXPIRY', 60))
+CONNECT_TIMEOUT = float(os.getenv('OPENAI_CONNECT_TIMEOUT', 5))
+READ_TIMEOUT = float(os.getenv('OPENAI_READ_TIMEOUT', 120))
+
+# In-flight request caps per kind of endpoint, e.g. OPENAI_CONCURRENCY_RUNS=32
+ENDPOINT_CONCURRENCY = {
+    'runs': int(os.getenv('OPENAI_CONCURRENCY_RUNS', 64)),
+    'threads': int(os.getenv('OPENAI_CONCURRENCY_THREADS', 16)),
+    'chat': int(os.getenv('OPENAI_CONCURRENCY_CHAT', 64)),
+}
+
+_clients = {}
+_async_clients = {}
+_assistants = {}
+_lock = threading.Lock()
+_endpoint_limits = {name: threading.BoundedSemaphore(limit) for name, limit in ENDPOINT_CONCURRENCY.items()}
+_async_endpoint_limits = {}
+
+
+def _limits():
+    return httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+
+
+def _timeout():
+    return httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+
+
+def get_client(api_key=None):
+    api_key = api_key or os.getenv('OPENAI_API_KEY')
+    client = _clients.get(api_key)
+    if client is None:
+        with _lock:
+            client = _clients.get(api_key)
+            if client is None:
+                http_client = DefaultHttpxClient(limits=_limits(), timeout=_timeout())
+                client = OpenAI(api_key=api_key, base_url=os.getenv('OPENAI_BASE_URL') or None, http_client=http_client)
+                _clients[api_key] = client
+    return client
+
+
+def get_async_client(api_key=None):
+    # Used by the ASGI server; one per API key, with the same pool settings as get_client
+    api_key = api_key or os.getenv('OPENAI_API_KEY')
+    client = _async_clients.get(api_key)
+    if client is None:
+        with _lock:
+            client = _async_clients.get(api_key)
+            if client is None:
+                http_client = DefaultAsyncHttpxClient(limits=_limits(), timeout=_timeout())
+                client = AsyncOpenAI(api_key=api_key, base_url=os.getenv('OPENAI_BASE_URL') or None, http_client=http_client)
+                _async_clients[api_key] = client
+    return client
+
+
+def get_assistant(role, api_key=None):
+    # Assistant objects never change at runtime, so each is retrieved once per process
+    assistant = _assistants.get(role)
+    if assistant is None:
+        assistant = get_client(api_key).beta.assistants.retrieve(ASSISTANT_IDS[role])
+        _assistants[role] = assistant
+    return assistant
+
+
+def warm_assistants(api_key=None):
+    for role in ASSISTANT_IDS:
+        get_assistant(role, api_key)
+
+
+@contextmanager
+def endpoint_limit(name):
+    with _endpoint_limits[name]:
+        yield
+
+
+@asynccontextmanager
+async def async_endpoint_limit(name):
+    # The event loop's counterpart of endpoint_limit, with the same caps
+    limit = _async_endpoint_limits.get(name)
+    if limit is None:
+        limit = _async_endpoint_limits.setdefault(name, asyncio.Semaphore(ENDPOINT_CONCURRENCY[name]))
+    async with limit:
+        yield
@@ -0,0 +1,357 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import openai
+
+from metrics import registry
+from openai_clients import async_endpoint_limit, endpoint_limit
+
+run_attempts = registry.counter('converso_run_attempts_total', 'Assistant run attempts, by role and outcome (ok, retried, hedge, lost, failed, deadline).')
+
+# Whole-call deadlines in seconds, retries and hedges included, e.g. RUN_DEADLINE_TUTOR=45
+DEFAULT_DEADLINES = {
+    'tutor': 60,
+    'help_detector': 8,
+    'response_score': 20,
+    'english_word_counter': 10,
+    'advanced_word_detector': 20,
+    'mistake_detector': 20,
+}
+
+# Errors worth another attempt: the request never reached a run, or the run died server side
+RETRYABLE_ERRORS = (openai.APIConnectionError, openai.APITimeoutError, openai.RateLimitError, openai.InternalServerError)
+RETRYABLE_RUN_ERRORS = ('server_error', 'rate_limit_exceeded')
+TERMINAL_RUN_STATUSES = ('completed', 'failed', 'cancelled', 'expired', 'incomplete')
+
+
+def parse_deadlines(env=os.environ):
+    return {role: float(env.get(f'RUN_DEADLINE_{role.upper()}', seconds)) for role, seconds in DEFAULT_DEADLINES.items()}
+
+
+class RunDeadlineExceeded(Exception):
+    pass
+
+
+class RunFailed(Exception):
+    def __init__(self, run):
+        error = getattr(run, 'last_error', None)
+        self.code = getattr(error, 'code', None)
+        super().__init__(f"Run {run.id} ended {run.status}: {getattr(error, 'message', '') or self.code}")
+
+    @property
+    def retryable(self):
+        return self.code in RETRYABLE_RUN_ERRORS
+
+
+class RetryBudget:
+    # Token bucket shared by every role: each first attempt earns `ratio` of a
+    # token and each retry or hedge spends one, so during an outage extra
+    # attempts stay under about ratio * normal traffic instead of multiplying it
+    def __init__(self, ratio=0.1, max_tokens=20):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class LatencyTracker:
+    # Recent successful run latencies per role, for the hedge delay
+    def __init__(self, window=200, min_samples=20):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def observe(self, role, seconds):
+        with self._lock:
+            self._samples.setdefault(role, deque(maxlen=self.window)).append(seconds)
+
+    def quantile(self, role, q):
+        with self._lock:
+            samples = sorted(self._samples.get(role, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class _Attempt:
+    def __init__(self, thread_id, handler, fresh_thread):
+        self.thread_id = thread_id
+        self.handler = handler
+        # Hedges and some retries run on a thread borrowed from the pool
+        self.fresh_thread = fresh_thread
+        self.stream = None
+        self.future = None
+        self.handled = False
+
+    @property
+    def run_created(self):
+        return getattr(self.handler, 'current_run', None) is not None
+
+
+class RunExecutor:
+    # Runs assistant streams under a per-role deadline. Failed attempts are
+    # retried with jittered exponential backoff while the deadline and the shared
+    # retry budget allow, and for hedge_roles a second run is started on a fresh
+    # thread once the first has taken longer than the role's recent p95; the
+    # first run to finish wins and the others are cancelled.
+    def __init__(self, client, thread_pool, deadlines=None, hedge_roles=(), max_attempts=3, base_backoff=0.25,
+                 max_backoff=2.0, hedge_quantile=0.95, default_hedge_delay=2.0, budget=None, max_workers=64):
+        self.client = client
+        self.thread_pool = thread_pool
+        self.deadlines = deadlines or dict(DEFAULT_DEADLINES)
+        self.hedge_roles = set(hedge_roles)
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.hedge_quantile = hedge_quantile
+        self.default_hedge_delay = default_hedge_delay
+        self.budget = budget or RetryBudget()
+        self.latencies = LatencyTracker()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='run')
+
+    def stream(self, role, thread_id, make_handler, **params):
+        # Returns the winning attempt's event handler, or raises RunDeadlineExceeded
+        # or the last attempt's error. make_handler() builds a fresh handler per attempt.
+        started = time.monotonic()
+        deadline = started + self.deadlines.get(role, DEFAULT_DEADLINES['tutor'])
+        hedge_at = started + self.hedge_delay(role) if role in self.hedge_roles else None
+        self.budget.deposit()
+
+        attempts = [self._start(role, thread_id, make_handler, params)]
+        retries = 0
+        last_error = None
+        try:
+            while True:
+                now = time.monotonic()
+                if now >= deadline:
+                    run_attempts.inc(role=role, outcome='deadline')
+                    raise RunDeadlineExceeded(f"{role} run missed its {deadline - started:.0f}s deadline") from last_error
+
+                active = [attempt for attempt in attempts if not attempt.handled]
+                wake_at = deadline if hedge_at is None else min(deadline, hedge_at)
+                wait([attempt.future for attempt in active], timeout=max(0, wake_at - now), return_when=FIRST_COMPLETED)
+
+                for attempt in active:
+                    if not attempt.future.done():
+                        continue
+                    attempt.handled = True
+                    self._release(attempt)
+                    error = attempt.future.exception()
+                    if error is None:
+                        self.latencies.observe(role, time.monotonic() - started)
+                        run_attempts.inc(role=role, outcome='ok')
+                        return attempt.handler
+                    last_error = error
+                    retry = self._retry_thread(role, attempt, thread_id, error)
+                    if retry is None or retries + 1 >= self.max_attempts or not self.budget.withdraw():
+                        run_attempts.inc(role=role, outcome='failed')
+                        if any(not other.handled for other in attempts):
+                            # A hedge is still running and may yet succeed
+                            continue
+                        raise error
+                    retries += 1
+                    run_attempts.inc(role=role, outcome='retried')
+                    time.sleep(max(0, min(self._backoff(retries), deadline - time.monotonic())))
+                    retry_thread_id, fresh_thread = retry
+                    attempts.append(self._start(role, retry_thread_id, make_handler, params, fresh_thread=fresh_thread))
+
+                if hedge_at is not None and time.monotonic() >= hedge_at:
+                    hedge_at = None
+                    if self.budget.withdraw():
+                        run_attempts.inc(role=role, outcome='hedge')
+                        attempts.append(self._start(role, None, make_handler, params, fresh_thread=True))
+        finally:
+            for attempt in attempts:
+                if not attempt.handled:
+                    run_attempts.inc(role=role, outcome='lost')
+                    self._abandon(attempt)
+
+    async def stream_async(self, async_client, role, thread_id, make_handler, **params):
+        # The event loop's counterpart: same deadline, retries and budget, no hedging
+        started = time.monotonic()
+        deadline = started + self.deadlines.get(role, DEFAULT_DEADLINES['tutor'])
+        self.budget.deposit()
+        retries = 0
+        while True:
+            handler = make_handler()
+            try:
+                await asyncio.wait_for(self._run_async(async_client, thread_id, handler, params), deadline - time.monotonic())
+                self.latencies.observe(role, time.monotonic() - started)
+                run_attempts.inc(role=role, outcome='ok')
+                return handler
+            except asyncio.TimeoutError as e:
+                run_attempts.inc(role=role, outcome='deadline')
+                await asyncio.to_thread(self._cancel_run, thread_id, handler)
+                raise RunDeadlineExceeded(f"{role} run missed its {deadline - started:.0f}s deadline") from e
+            except (*RETRYABLE_ERRORS, RunFailed) as e:
+                # No fresh threads here, so only retry when nothing is left running on this
+                # one, and never once text has reached the caller
+                if getattr(handler, 'first_token_at', None) is not None:
+                    retryable = False
+                elif isinstance(e, RunFailed):
+                    retryable = e.retryable
+                else:
+                    retryable = getattr(handler, 'current_run', None) is None
+                if not retryable or retries + 1 >= self.max_attempts or not self.budget.withdraw():
+                    run_attempts.inc(role=role, outcome='failed')
+                    raise
+                retries += 1
+                run_attempts.inc(role=role, outcome='retried')
+                await asyncio.sleep(max(0, min(self._backoff(retries), deadline - time.monotonic())))
+
+    async def _run_async(self, async_client, thread_id, handler, params):
+        async with async_endpoint_limit('runs'), async_client.beta.threads.runs.stream(
+                thread_id=thread_id, event_handler=handler, **params) as stream:
+            await stream.until_done()
+        self._check_run(handler)
+
+    def _backoff(self, retries):
+        # Exponential with full +/-50% jitter so retries from many sessions spread out
+        return min(self.max_backoff, self.base_backoff * 2 ** (retries - 1)) * random.uniform(0.5, 1.5)
+
+    def call(self, role, fn, can_retry=lambda error: True):
+        # Deadline, retries and budget for calls that are not Assistants runs, such
+        # as chat completions. fn(timeout) is given the seconds left to the deadline.
+        started = time.monotonic()
+        deadline = started + self.deadlines.get(role, DEFAULT_DEADLINES['tutor'])
+        self.budget.deposit()
+        retries = 0
+        while True:
+            try:
+                result = fn(self._remaining(role, started, deadline))
+                self.latencies.observe(role, time.monotonic() - started)
+                run_attempts.inc(role=role, outcome='ok')
+                return result
+            except RETRYABLE_ERRORS as e:
+                error = e
+            retries = self._before_retry(role, error, retries, started, deadline, can_retry)
+            time.sleep(max(0, min(self._backoff(retries), deadline - time.monotonic())))
+
+    async def call_async(self, role, fn, can_retry=lambda error: True):
+        # call() for coroutines: fn(timeout) returns an awaitable
+        started = time.monotonic()
+        deadline = started + self.deadlines.get(role, DEFAULT_DEADLINES['tutor'])
+        self.budget.deposit()
+        retries = 0
+        while True:
+            try:
+                result = await fn(self._remaining(role, started, deadline))
+                self.latencies.observe(role, time.monotonic() - started)
+                run_attempts.inc(role=role, outcome='ok')
+                return result
+            except RETRYABLE_ERRORS as e:
+                error = e
+            retries = self._before_retry(role, error, retries, started, deadline, can_retry)
+            await asyncio.sleep(max(0, min(self._backoff(retries), deadline - time.monotonic())))
+
+    def _remaining(self, role, started, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            run_attempts.inc(role=role, outcome='deadline')
+            raise RunDeadlineExceeded(f"{role} call missed its {deadline - started:.0f}s deadline")
+        return remaining
+
+    def _before_retry(self, role, error, retries, started, deadline, can_retry):
+        # Raises if error ends the call, otherwise returns the new retry count
+        if isinstance(error, openai.APITimeoutError) and time.monotonic() >= deadline:
+            run_attempts.inc(role=role, outcome='deadline')
+            raise RunDeadlineExceeded(f"{role} call missed its {deadline - started:.0f}s deadline") from error
+        if not can_retry(error) or retries + 1 >= self.max_attempts or not self.budget.withdraw():
+            run_attempts.inc(role=role, outcome='failed')
+            raise error
+        run_attempts.inc(role=role, outcome='retried')
+        return retries + 1
+
+    def hedge_delay(self, role):
+        delay = self.latencies.quantile(role, self.hedge_quantile)
+        return self.default_hedge_delay if delay is None else delay
+
+    def _start(self, role, thread_id, make_handler, params, fresh_thread=False):
+        if fresh_thread:
+            thread_id = self.thread_pool.take(f"{role}_thread").id
+        attempt = _Attempt(thread_id, make_handler(), fresh_thread)
+        attempt.future = self._pool.submit(self._run, attempt, params)
+        return attempt
+
+    def _run(self, attempt, params):
+        with endpoint_limit('runs'), self.client.beta.threads.runs.stream(
+                thread_id=attempt.thread_id, event_handler=attempt.handler, **params) as stream:
+            attempt.stream = stream
+            stream.until_done()
+        self._check_run(attempt.handler)
+
+    def _check_run(self, handler):
+        run = getattr(handler, 'current_run', None)
+        if run is not None and run.status in ('failed', 'expired', 'incomplete'):
+            raise RunFailed(run)
+
+    def _retry_thread(self, role, attempt, thread_id, error):
+        # Returns (thread_id, fresh_thread) for the next attempt, or None if the error is final
+        if isinstance(error, RunFailed):
+            if not error.retryable:
+                return None
+        elif not isinstance(error, RETRYABLE_ERRORS):
+            return None
+        if attempt.handler.first_token_at is not None:
+            # Text has already reached the caller; a second run would send it all again
+            return None
+        if attempt.fresh_thread:
+            # A borrowed thread is retired as soon as its attempt ends; never reuse it
+            return None, True
+        if isinstance(error, RunFailed) or not attempt.run_created:
+            # The failed run is over, or never started, so the caller's thread is free
+            return thread_id, False
+        # A run may still be active on the thread; retry elsewhere unless the
+        # thread is the conversation itself
+        if role == 'tutor':
+            return None
+        return None, True
+
+    def _release(self, attempt):
+        if attempt.fresh_thread and attempt.thread_id is not None:
+            self.thread_pool.retire([attempt.thread_id])
+            attempt.thread_id = None
+
+    def _abandon(self, attempt):
+        if attempt.future.done():
+            self._release(attempt)
+            return
+        # Stop reading the stream and cancel the run in the background; the attempt's
+        # own worker releases a borrowed thread once it unwinds
+        stream = attempt.stream
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception:
+                pass
+        thread_id = attempt.thread_id
+        self._pool.submit(self._cancel_run, thread_id, attempt.handler)
+        if attempt.fresh_thread:
+            attempt.future.add_done_callback(lambda _: self.thread_pool.retire([thread_id]))
+
+    def _cancel_run(self, thread_id, handler):
+        run = getattr(handler, 'current_run', None)
+        if run is None or run.status in TERMINAL_RUN_STATUSES or thread_id is None:
+            return
+        try:
+            with endpoint_limit('runs'):
+                self.client.beta.threads.runs.cancel(run.id, thread_id=thread_id)
+        except openai.OpenAIError as e:
+            print(f"Could not cancel run {run.id}: {e}")
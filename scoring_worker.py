@@ -0,0 +1,35 @@
+import queue
+import threading
+
+
+class ScoringWorker:
+    # A small pool of grading threads. Every job is routed by key to one fixed
+    # thread, so jobs for the same session always run one at a time, in the
+    # order they were submitted, while different sessions grade in parallel.
+    def __init__(self, num_workers=4, name='scoring'):
+        self._queues = [queue.Queue() for _ in range(max(1, num_workers))]
+        self._threads = []
+        for index, jobs in enumerate(self._queues):
+            thread = threading.Thread(target=self._run, args=(jobs,), name=f"{name}-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, key, fn, *args):
+        self._queues[hash(key) % len(self._queues)].put((fn, args))
+
+    def pending(self):
+        return sum(jobs.qsize() for jobs in self._queues)
+
+    def join(self):
+        for jobs in self._queues:
+            jobs.join()
+
+    def _run(self, jobs):
+        while True:
+            fn, args = jobs.get()
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"Scoring job failed: {e}")
+            finally:
+                jobs.task_done()
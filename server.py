@@ -1,20 +1,37 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-from openai import OpenAI
 import openai
-from typing_extensions import override
-from openai import AssistantEventHandler
 import numpy as np
 import json 
 import re
-import spacy
+import math
 from scipy import spatial
 # from common_english_words import word_list_set
-from spellchecker import SpellChecker
-import language_tool_python
 import os
+import threading
+import itertools
+import queue
+from types import SimpleNamespace
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 import requests
 from dotenv import load_dotenv
+from sessions import SessionManager
+from openai_clients import ENDPOINT_CONCURRENCY, get_assistant, get_client, warm_assistants
+from scoring_worker import ScoringWorker
+import elo
+from skill_tracker import SkillTracker
+from categories import CategoryIndex, DEFAULT_CATEGORY
+from vocabulary import VocabularyIndex
+from english_words import EnglishWordDetector
+from help_classifier import HelpClassifier
+from context_window import ConversationContext, parse_token_budgets
+from nlp_resources import NLPResources, language_code
+from state_store import StateWriter, open_state_store
+from thread_pool import AssistantThreadPool
+from run_executor import RetryBudget, RunDeadlineExceeded, RunExecutor, parse_deadlines
+from engines import ENGINE_ROLES, AssistantsEngine, ChatCompletionsEngine
+from classifier_cache import ClassifierCache, SharedCacheStore
+from metrics import context_tokens, registry, timed, tutor_first_token_seconds
 
 
 
@@ -29,81 +46,112 @@ if not api_key:
     raise ValueError("API key not found. Please set the OPENAI_API_KEY environment variable.")
 
 print(f"API Key: {api_key}")
-# Initialize LanguageTool for grammar checking
-tool = language_tool_python.LanguageTool('es')  # Set to Spanish
 
-# Initialize SpellChecker for Spanish
-spell = SpellChecker(language='es')
+# RECORD_TRAFFIC_PATH=bench/traffic.jsonl records set-up and turn requests for bench/load.py to replay
+if os.getenv('RECORD_TRAFFIC_PATH'):
+    from bench.traffic import TrafficRecorder
+    traffic_recorder = TrafficRecorder(os.environ['RECORD_TRAFFIC_PATH'])
+    app.before_request(lambda: traffic_recorder.record(request.path, request.get_json(silent=True) or {}))
 
-
-
-# Load the spaCy model
-nlp = spacy.load('en_core_web_md')
-word_list_set = set(nlp.vocab.strings)
-
-class EventHandler(AssistantEventHandler):    
-    def __init__(self):
-            super().__init__()
-            # self.user_progress = user_progress
-            self.current_response = ""
-    @override
-    def on_text_created(self, text) -> None:
-        print(f"\nassistant > ", end="", flush=True)
-        
-    @override
-    def on_text_delta(self, delta, snapshot):
-        print(delta.value, end="", flush=False)
-        self.current_response += delta.value
-        
-    def on_tool_call_created(self, tool_call):
-        print(f"\nassistant > {tool_call.type}\n", flush=True)
-    
-    def on_tool_call_delta(self, delta, snapshot):
-        if delta.type == 'code_interpreter':
-            if delta.code_interpreter.input:
-                print(delta.code_interpreter.input, end="", flush=True)
-            if delta.code_interpreter.outputs:
-                print(f"\n\noutput >", flush=True)
-                for output in delta.code_interpreter.outputs:
-                    if output.type == "logs":
-                        print(f"\n{output.logs}", flush=True)
+# spaCy and the per-language spell lexicons are loaded on first use and shared by
+# every session. Warm-up runs in the background; /ready reports when it is done.
+nlp_resources = NLPResources()
+nlp_resources.warm_up(os.getenv('WARM_LANGUAGES', 'es').split(','))
 
 # Then, we use the `stream` SDK helper 
 # with the `EventHandler` class to create the Run 
 # and stream the response.
 
-def load_elo_samples(file_path):
-    file_path = os.path.join(os.path.dirname(__file__), file_path)
-    with open(file_path, 'r') as file:
-        return json.load(file)
+# Parsed <language>_categories.json files, loaded once and reloaded only when edited
+category_index = CategoryIndex()
+category_index.preload()
+
+# Per-level conversation token budgets, e.g. CONTEXT_TOKEN_BUDGETS="A1=800,C2=4000"
+CONTEXT_TOKEN_BUDGETS = parse_token_budgets(os.getenv('CONTEXT_TOKEN_BUDGETS'))
+
+# Per-language word -> CEFR level lookup built from the categories' vocabulary files
+vocabulary_index = VocabularyIndex(category_index)
+
+# English words are counted locally against the spaCy vocabulary; set ENGLISH_WORD_COUNTER=llm
+# to go back to the english_word_counter_assistant run
+ENGLISH_WORD_COUNTER = os.getenv('ENGLISH_WORD_COUNTER', 'local')
+
+def target_language_lexicons(language):
+    # Anything known in the target language is not counted as English, which covers cognates
+    spell = nlp_resources.spell_lexicon(language_code(language))
+    return [lexicon for lexicon in (spell, vocabulary_index.get(language)) if lexicon is not None]
+
+english_word_detector = EnglishWordDetector(nlp_resources.english_lexicon, target_language_lexicons)
 
-def get_random_elo(user_rating, mean=0, std_dev=400):
-    random_elo = int(np.random.normal(user_rating, std_dev))
-    return max(0, min(2000, random_elo))
+# Tokenizer-only docs are enough for averaged word vectors and skip the rest of the pipeline
+help_classifier = HelpClassifier(
+    english_word_count=lambda message, language: english_word_detector.count([message], language)[0],
+    vectorize=lambda text: nlp_resources.nlp().make_doc(text).vector,
+    margin=float(os.getenv('HELP_CLASSIFIER_MARGIN', 0.08)),
+)
+registry.add_collector(help_classifier.metric_lines)
+
+# The help detector, response score and English counter assistants answer the same input
+# the same way, so their JSON results are memoized per assistant. CLASSIFIER_CACHE_PATH
+# names a SQLite file shared by every worker on the host; unset keeps the cache per process.
+classifier_cache = ClassifierCache(
+    max_size=int(os.getenv('CLASSIFIER_CACHE_SIZE', 10000)),
+    ttl=float(os.getenv('CLASSIFIER_CACHE_TTL', 3600)),
+    shared_store=SharedCacheStore(os.environ['CLASSIFIER_CACHE_PATH']) if os.getenv('CLASSIFIER_CACHE_PATH') else None,
+)
+registry.add_collector(classifier_cache.metric_lines)
+
+
+def record_first_token(event_handler):
+    time_to_first_token = event_handler.time_to_first_token()
+    if time_to_first_token is not None:
+        tutor_first_token_seconds.observe(time_to_first_token)
+
+def get_random_elo(user_rating, mean=0, std_dev=elo.DEFAULT_SPREAD):
+    return int(elo.sample_difficulty(user_rating, std_dev))
 
 # Map ELO to CEFR levels
 def elo_to_cefr(elo_rating):
-    if 0 <= elo_rating <= 333:
-        return "A1"
-    elif 334 <= elo_rating <= 666:
-        return "A2"
-    elif 667 <= elo_rating <= 1000:
-        return "B1"
-    elif 1001 <= elo_rating <= 1333:
-        return "B2"
-    elif 1334 <= elo_rating <= 1666:
-        return "C1"
-    elif 1667 <= elo_rating <= 2000:
-        return "C2"
-    else:
-        return "Unknown"
+    return str(elo.cefr_levels(elo_rating))
+
+# K factor of the rating update; python -m elo simulates the effect of changing it
+ELO_K = float(os.getenv('ELO_K', elo.DEFAULT_K))
+
+# Grammar mistake counts of every learner in memory, in one topics x learners matrix.
+# Counts decay by 0.8 per SKILL_DECAY_INTERVAL seconds.
+skill_tracker = SkillTracker(decay_interval=float(os.getenv('SKILL_DECAY_INTERVAL', 300)))
+# Tells apart the chats one session has been loaded into, for skill_tracker keys
+skill_generations = itertools.count()
+
+# Grading runs for a turn are fanned out onto this pool and joined with a timeout.
+# Set CONCURRENT_TURNS=0 to run them inline, one after another, as before.
+CONCURRENT_TURNS = os.getenv('CONCURRENT_TURNS', '1') != '0'
+SCORING_TIMEOUT = float(os.getenv('SCORING_TIMEOUT', 30))
+turn_executor = ThreadPoolExecutor(max_workers=int(os.getenv('TURN_WORKERS', 32)), thread_name_prefix='turn')
+
+# Ratings are computed off the request path; each session's turns are graded in order
+scoring_worker = ScoringWorker(num_workers=int(os.getenv('SCORING_WORKERS', 4)))
+
+def submit_turn_task(fn, *args):
+    if CONCURRENT_TURNS:
+        return turn_executor.submit(fn, *args)
+    future = Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+def join_turn_task(future, name, default=None, timeout=None):
+    try:
+        return future.result(timeout=SCORING_TIMEOUT if timeout is None else timeout)
+    except FutureTimeoutError:
+        print(f"{name} timed out")
+        future.cancel()
+    except Exception as e:
+        print(f"{name} failed: {e}")
+    return default
 
-def load_vocabulary(vocabulary_files):
-    vocabulary = []
-    for vocab_file in vocabulary_files:
-        with open(f'./{vocab_file}', 'r') as file:
-            vocabulary.extend(file.read().splitlines())
-    return vocabulary
 
 
 
@@ -115,122 +163,154 @@ class OpenAIChat:
         self.users_rating = 300
         self.users_cefr_level = elo_to_cefr(self.users_rating)
         self.topic_to_practice = None
-        self.lesson_recommender_tracker = {
-            "Present Tense Verbs": 0,
-            "Preterite Tense": 0,
-            "Imperfect Tense": 0,
-            "Future Tense": 0,
-            "Conditional Tense": 0,
-            "Subjunctive Mood": 0,
-            "Reflexive Verbs": 0,
-            "Commands (Imperatives)": 0,
-            "Possessive Adjectives": 0,
-            "Possessive Pronouns": 0,
-            "Direct Object Pronouns": 0,
-            "Indirect Object Pronouns": 0,
-            "Double Object Pronouns": 0,
-            "Gustar and Similar Verbs": 0,
-            "Ser vs. Estar": 0,
-            "Por vs. Para": 0,
-            "Comparatives and Superlatives": 0,
-            "Demonstrative Adjectives": 0,
-            "Demonstrative Pronouns": 0,
-            "Interrogative Words": 0,
-            "Negative Words": 0,
-            "Adverbs": 0,
-            "Prepositions": 0,
-            "Articles": 0,
-            "Gender and Number Agreement": 0,
-            "Noun-Adjective Agreement": 0,
-            "Sentence Structure": 0,
-            "Questions and Exclamations": 0,
-            "Passive Voice": 0,
-            "Relative Pronouns": 0,
-            "Conditional Sentences": 0,
-            "Idiomatic Expressions": 0,
-            "Numbers": 0,
-            "Time Expressions": 0,
-            "Conjunctions": 0,
-            "Gerunds and Present Participles": 0,
-            "Infinitives": 0,
-            "Future Perfect": 0,
-            "Past Perfect (Pluperfect)": 0,
-            "Imperfect Subjunctive": 0
-        }
-        self.client = OpenAI(api_key=api_key)
+        # One pooled client and one set of retrieved assistants are shared by every chat
+        self.client = get_client(api_key)
         # self.expected_response_client = OpenAI(api_key=api_key)
         self.language = None
-        self.assistant = self.client.beta.assistants.retrieve("asst_XDSA4hq7fq8fd0pdtAb0iUTG")
-        self.advanced_word_detector_assistant = self.client.beta.assistants.retrieve("asst_gZ5kpgBJaPbWcKz3YrWgmtUk")
-        self.english_word_counter_assistant = self.client.beta.assistants.retrieve('asst_QHN8ywHLkU7wLp10G7dgENtT')
-        self.response_score_assistant = self.client.beta.assistants.retrieve("asst_HH1NiwYkrgXKoUrNI1sPEQoL")
-        self.help_detector_assistant = self.client.beta.assistants.retrieve("asst_qPLbwpxRHY7dnM9G9fewViQk")
-        self.mistake_detector_assistant = self.client.beta.assistants.retrieve("asst_NKpMtClPEqj8xHlQ46LM9304")
-        self.thread = self.client.beta.threads.create()
-        self.advanced_word_detector_thread = self.client.beta.threads.create()
-        self.response_score_thread = self.client.beta.threads.create()
-        self.english_word_counter_thread = self.client.beta.threads.create()
-        self.help_detector_thread = self.client.beta.threads.create()
-        self.mistake_detector_thread = self.client.beta.threads.create()
-        self.tool = language_tool_python.LanguageTool('es')  # Set to Spanish
-        self.spell = SpellChecker(language='es')  # Spanish spell checker
+        self.assistant = get_assistant('tutor', api_key)
+        self.advanced_word_detector_assistant = get_assistant('advanced_word_detector', api_key)
+        self.english_word_counter_assistant = get_assistant('english_word_counter', api_key)
+        self.response_score_assistant = get_assistant('response_score', api_key)
+        self.help_detector_assistant = get_assistant('help_detector', api_key)
+        self.mistake_detector_assistant = get_assistant('mistake_detector', api_key)
+        # Threads are created on first use so a new session costs no round trips up front
+        self._threads = {}
+        self._threads_lock = threading.Lock()
         
         self.user_response = None
         self.bot_response = None
-        self.chat_messages = []
-        print(f"Thread ID: {self.thread.id}")
+        # Recent turns within the level's token budget plus a summary of older ones
+        self.context = ConversationContext(budgets=CONTEXT_TOKEN_BUDGETS)
+        # Guards users_rating while background grading updates it
+        self.rating_condition = threading.Condition()
+        self.pending_gradings = 0
+        self.rating_version = 0
+        # Bumped on reset so gradings queued before the reset are dropped
+        self.grading_epoch = 0
+        # Set by load_chat; state changes are queued on state_writer under session_id
+        self.session_id = None
+        self.state_writer = None
+        # The stored state version this chat last read or wrote; see StateWriter
+        self.state_version = 0
+        self.state_conflict = False
+        self.skill_generation = next(skill_generations)
+        # Rating and mistake changes since the last save_state, re-applied to the stored state if that save loses a race
+        self._state_delta = self._empty_state_delta()
+        # Set once an evicted chat's final state is saved; later saves would overwrite newer state
+        self.evicted = False
         print(f"OpenAI API Version: {openai.__version__}")
 
-    def send_message(self, message):
-    
-        self.user_response = message
+    def _get_thread(self, role):
+        with self._threads_lock:
+            thread = self._threads.get(role)
+            if thread is None:
+                thread = thread_pool.take(role)
+                self._threads[role] = thread
+                print(f"{role} ID: {thread.id}")
+            return thread
 
-        help_detector_bot_event_handler  = EventHandler()
-        with self.client.beta.threads.runs.stream(
-            
-                thread_id=self.help_detector_thread.id,
-                assistant_id=self.help_detector_assistant.id,
-                additional_messages=[{"role": "user","content": self.user_response}],
-                event_handler= help_detector_bot_event_handler,
-        ) as stream:
-            stream.until_done()
-        response_json = json.loads(help_detector_bot_event_handler.current_response)
-        user_asking_for_help = response_json.get('user_asking_for_help', 0)
+    @property
+    def thread(self):
+        return self._get_thread("thread")
+
+    @property
+    def advanced_word_detector_thread(self):
+        return self._get_thread("advanced_word_detector_thread")
+
+    @property
+    def response_score_thread(self):
+        return self._get_thread("response_score_thread")
+
+    @property
+    def english_word_counter_thread(self):
+        return self._get_thread("english_word_counter_thread")
+
+    @property
+    def help_detector_thread(self):
+        return self._get_thread("help_detector_thread")
+
+    @property
+    def mistake_detector_thread(self):
+        return self._get_thread("mistake_detector_thread")
+
+    def send_message(self, message, on_delta=None):
+    
+        # Obvious cases are decided locally; only ambiguous messages go to the assistant
+        with timed('help_detection'):
+            user_asking_for_help = help_classifier.classify(message, self.language)
+            if user_asking_for_help is None:
+                user_asking_for_help = self.detect_help_request(message)
         print("User is asking for help?:", user_asking_for_help )
 
-        elo_examples = load_elo_samples(f"{self.language}_categories.json")
-        new_prompt, difficult_level_of_bot = self.generate_prompt(user_rating=self.users_rating,elo_samples=elo_examples,topic=self.topic_to_practice, is_user_asking_for_help=user_asking_for_help)
+        turn = self.prepare_turn(message, user_asking_for_help)
+
+        with timed('tutor_run'):
+            try:
+                event_handler = role_engines['tutor'].reply(self, turn, sinks=[on_delta] if on_delta else None)
+            except Exception:
+                self.abandon_turn(turn)
+                raise
+        record_first_token(event_handler)
+
+        return self.finish_turn(turn, event_handler.current_response)
+
+    @timed('prompt_generation')
+    def prepare_turn(self, message, user_asking_for_help):
+        # Everything a turn does before the tutor run; shared by the sync and async servers
+        self.user_response = message
+
+        engine = role_engines['tutor']
+        elo_examples = category_index.get(self.language)
+        new_prompt, difficult_level_of_bot = self.generate_prompt(user_rating=self.users_rating,elo_samples=elo_examples,topic=self.topic_to_practice, is_user_asking_for_help=user_asking_for_help, engine=engine)
         print("topic to practice: ", self.topic_to_practice)
         print("this is current prompt: ", new_prompt)
 
         additional_instructions = ''
-        if not user_asking_for_help:
+        if not user_asking_for_help and engine.uses_file_search:
             additional_instructions = """
                 1.) Read your instructions 
                 2.) Use your file_search function to look at only the files you are allowed to use the vocabulary from 
                 3.) Respond
             """
     
-        
-        print(new_prompt)
-    
-        event_handler = EventHandler()
-        self.chat_messages.append({"role": "user", "content": message})
-        with self.client.beta.threads.runs.stream(
-                thread_id=self.thread.id,
-                assistant_id=self.assistant.id,
-                additional_messages=self.chat_messages,
-                instructions=new_prompt,
-                additional_instructions=additional_instructions,
-                event_handler=event_handler,
-        ) as stream:
-            stream.until_done()
-        self.chat_messages.append({"role": "assistant", "content": event_handler.current_response})
-
+        # The thread already holds earlier turns, so only the new message is added and
+        # the run is truncated to the budgeted window; older turns reach it as a summary
+        self.context.append("user", message)
+        window, summary = self.context.build(elo_to_cefr(self.users_rating), instructions=new_prompt + additional_instructions)
+        if summary:
+            additional_instructions += f"\nSummary of the earlier conversation: {summary}"
+        print(f"Context tokens this turn: {self.context.last_turn_tokens} ({len(window)} messages)")
+        context_tokens.observe(self.context.last_turn_tokens)
+
+        return {
+            'message': message,
+            'previous_bot_response': self.bot_response,
+            'user_asking_for_help': user_asking_for_help,
+            'difficulty_level': difficult_level_of_bot,
+            'instructions': new_prompt,
+            'additional_instructions': additional_instructions,
+            'window': window,
+        }
 
+    def abandon_turn(self, turn):
+        # The tutor never answered; drop the learner's message so the next turn's
+        # window doesn't open with two user messages in a row
+        self.context.retract("user", turn['message'])
+
+    def tutor_run_params(self, turn):
+        return {
+            'thread_id': self.thread.id,
+            'assistant_id': self.assistant.id,
+            'additional_messages': [{"role": "user", "content": turn['message']}],
+            'instructions': turn['instructions'],
+            'additional_instructions': turn['additional_instructions'],
+            'truncation_strategy': {"type": "last_messages", "last_messages": len(turn['window'])},
+        }
 
+    def finish_turn(self, turn, bot_response):
+        self.context.append("assistant", bot_response)
 
-        if self.bot_response is not None and user_asking_for_help != 'yes':
+        if turn['previous_bot_response'] is not None and turn['user_asking_for_help'] != 'yes':
             # mistake_detector_event_handler = EventHandler()
             # with self.client.beta.threads.runs.stream(
             
@@ -245,25 +325,57 @@ class OpenAIChat:
             # print(mistakes)
             # mistake_types = mistakes.get('mistake_type', 0)
             # print(mistake_types)
-            self.calculate_updated_rating(user_response=self.user_response, expected_response=self.bot_response, difficulty_level=difficult_level_of_bot)
+            # Grading happens on the scoring worker; the reply doesn't wait for it
+            self.queue_grading(user_response=turn['message'], expected_response=turn['previous_bot_response'], difficulty_level=turn['difficulty_level'])
 
         # Set the final bot response
-        self.bot_response = event_handler.current_response
+        self.bot_response = bot_response
+        self.save_state()
 
         # Return the final bot response
         return self.bot_response, self.users_rating
     
+    @property
+    def chat_messages(self):
+        return self.context.messages
+
+    def run_classifier(self, role, content):
+        # One JSON answer from the role's engine, served from classifier_cache when
+        # the same input has been classified before
+        engine = role_engines[role]
+        return classifier_cache.get_or_compute(engine.cache_key(self, role), content, lambda: engine.classify(self, role, content), role=role)
+
+    async def run_classifier_async(self, role, content):
+        # run_classifier with the engine's run awaited on the event loop
+        engine = role_engines[role]
+        return await classifier_cache.get_or_compute_async(engine.cache_key(self, role), content, lambda: engine.classify_async(self, role, content), role=role)
+
+    @timed('help_detection_assistant')
+    def detect_help_request(self, message):
+        try:
+            return self.run_classifier('help_detector', message).get('user_asking_for_help', 0)
+        except RunDeadlineExceeded as e:
+            # Carry on with the normal conversation rather than hold up the turn
+            print(f"{e}, treating the message as not asking for help")
+            return 'no'
+
+    @property
+    def lesson_recommender_tracker(self):
+        # Mistake counts per grammar topic, decayed to now; kept in the shared skill_tracker
+        return skill_tracker.scores(self.skill_key)
+
+    @property
+    def skill_key(self):
+        # The session id plus this load's generation: an evicted chat's last gradings
+        # may still be recording scores after the session is loaded again
+        return (self.session_id, self.skill_generation)
+
     def update_lesson_recommender_tracker(self, mistakes):
-        decay_factor = 0.8
         # When the value of a certain mistake type hits 10, then it will recommend to the uesr that specific lesson
-        lessons_to_recommend = []
-        for mistake_type in mistakes:
-            self.lesson_recommender_tracker[mistake_type] += 1
-        for mistake_type in self.lesson_recommender_tracker:
-            if self.lesson_recommender_tracker[mistake_type] >= 10:
-                lessons_to_recommend.append(mistake_type)
-                continue
-            self.lesson_recommender_tracker[mistake_type] *= decay_factor
+        skill_tracker.record(self.skill_key, mistakes)
+        with self.rating_condition:
+            self._state_delta['mistakes'].extend(mistakes)
+        lessons_to_recommend = skill_tracker.recommend(self.skill_key)
         if len(lessons_to_recommend) >= 1:
             print(lessons_to_recommend)
             print(f' I have noticed that you struggle with this particular concept: {lessons_to_recommend[0]}. I recommend you take a lesson to work on this.')
@@ -271,20 +383,15 @@ class OpenAIChat:
     
 
     
-    def generate_prompt(self, user_rating, elo_samples, topic, is_user_asking_for_help):
+    def generate_prompt(self, user_rating, elo_samples, topic, is_user_asking_for_help, engine=None):
         random_elo = get_random_elo(user_rating)
         self.cefr_level = elo_to_cefr(random_elo)
-        vocab_json_file = load_elo_samples(f"{self.language}_categories.json")
         print(random_elo)
         print(self.cefr_level)
-        category_data = vocab_json_file.get("General Conversation")
-        
-        level_data = category_data.get(self.cefr_level)
-        
-
-        vocab_files = level_data.get("vocabulary")
-        vocabulary_files_str = ", ".join(vocab_files)
-        grammar = level_data.get("grammar")
+        level_data = elo_samples.get(DEFAULT_CATEGORY).get(self.cefr_level)
+        # The assistants find the level's vocabulary files with file_search; other engines get the words inline
+        vocabulary_files_str = (engine or role_engines['tutor']).tutor_vocabulary(self, level_data)
+        grammar = level_data.grammar_str
 
         if is_user_asking_for_help == 'yes':
             return (
@@ -304,6 +411,92 @@ class OpenAIChat:
 
             )
         
+    def to_state(self):
+        with self.rating_condition:
+            users_rating = self.users_rating
+        tracker, decayed_at = skill_tracker.snapshot(self.skill_key)
+        return {
+            'language': self.language,
+            'topic_to_practice': self.topic_to_practice,
+            'users_rating': users_rating,
+            'lesson_recommender_tracker': tracker,
+            'lesson_recommender_decayed_at': decayed_at,
+            'bot_response': self.bot_response,
+            'context': self.context.to_state(),
+            'thread_ids': {role: thread.id for role, thread in list(self._threads.items()) if role not in SCRATCH_THREAD_ROLES},
+        }
+
+    def load_state(self, state):
+        self.language = state.get('language')
+        self.topic_to_practice = state.get('topic_to_practice')
+        self.users_rating = state.get('users_rating', self.users_rating)
+        # Decay resumes from when the scores were saved, not from when they were loaded
+        skill_tracker.load(self.skill_key, state.get('lesson_recommender_tracker', {}), now=state.get('lesson_recommender_decayed_at'))
+        self.bot_response = state.get('bot_response')
+        self.context.load_state(state.get('context', {}))
+        # Only the ids are needed to keep using the learner's existing threads; scratch threads aren't saved
+        with self._threads_lock:
+            self._threads = {role: thread for role, thread in self._threads.items() if role in SCRATCH_THREAD_ROLES}
+            self._threads.update((role, SimpleNamespace(id=thread_id)) for role, thread_id in state.get('thread_ids', {}).items())
+
+    @staticmethod
+    def _empty_state_delta():
+        return {'users_rating': 0, 'mistakes': []}
+
+    def save_state(self):
+        # Coalesced with other pending writes and flushed in the background
+        if self.state_writer is None or self.session_id is None or self.evicted:
+            return
+        with self.rating_condition:
+            state = self.to_state()
+            delta, self._state_delta = self._state_delta, self._empty_state_delta()
+        self.state_writer.schedule(self.session_id, state, owner=self, delta=delta)
+
+    def state_conflicted(self, deltas):
+        # StateWriter dropped a save because another worker wrote first. Reload before
+        # the next turn, and meanwhile add the dropped save's changes to the newer state
+        self.state_conflict = True
+        if any(delta['users_rating'] or delta['mistakes'] for delta in deltas):
+            scoring_worker.submit(self, self._reapply_state_deltas, deltas)
+
+    def _reapply_state_deltas(self, deltas, attempts=5):
+        store = self.state_writer.store
+        for _ in range(attempts):
+            state, version = store.load(self.session_id)
+            if state is None:
+                return
+            state = dict(state)
+            if state.get('users_rating') is not None:
+                state['users_rating'] = max(0, state['users_rating'] + sum(delta['users_rating'] for delta in deltas))
+            tracker = dict(state.get('lesson_recommender_tracker', {}))
+            for delta in deltas:
+                for topic in delta['mistakes']:
+                    tracker[topic] = tracker.get(topic, 0.0) + 1
+            state['lesson_recommender_tracker'] = tracker
+            if store.save_many({self.session_id: (state, version)}).get(self.session_id) is not None:
+                return
+        print(f"Could not re-apply rating changes for {self.session_id}: the state kept changing")
+
+    def sync_state(self):
+        # Called under the session lock before a turn: another worker may have served
+        # this learner since, or won a race to save, so pick up the newer state
+        if self.state_writer is None or self.session_id is None:
+            return
+        store = self.state_writer.store
+        if not self.state_conflict and store.version(self.session_id) <= self.state_version:
+            return
+        state, version = store.load(self.session_id)
+        if state is not None:
+            self.load_state(state)
+        self.state_version, self.state_conflict = version, False
+
+    def release_threads(self, roles):
+        # Drops the session's threads for these roles and has the pool delete them;
+        # the next use of a role takes a fresh thread
+        with self._threads_lock:
+            released = [self._threads.pop(role).id for role in roles if role in self._threads]
+        thread_pool.retire(released)
+
     def set_chat_topic(self, topic):
         
         self.topic_to_practice = topic
@@ -319,26 +512,24 @@ class OpenAIChat:
 
         self.user_response = None
         self.bot_response = None
-        self.chat_messages = []
-        self.users_rating = None
+        self.context.reset()
+        with self.rating_condition:
+            self.grading_epoch += 1
+            self.users_rating = None
+            self._state_delta = self._empty_state_delta()
         
         self.topic_to_practice = None
         # Reset any other stateful attributes here if necessary
+        # The old tutor thread still holds the previous conversation; start the next one on a fresh thread
+        self.release_threads(['thread'])
+        self.save_state()
         print("Chat has been reset.")
         
+    @timed('advanced_vocab_scoring')
     def calculate_advanced_vocab_score(self, user_response, user_cefr_level):
-        # Get the vocabulary for levels above the user's current level
-        advanced_vocab = self.get_advanced_vocabulary(user_cefr_level)
-        # print(advanced_vocab)
-
-        is_in_advanced_vocab = "bien" in advanced_vocab
-
-        # Print the result
-        print(is_in_advanced_vocab)  
-        
-        # Check if user response contains advanced vocabulary
+        # Check if user response contains vocabulary above the user's current level
         words = set(re.findall(r'\b\w+\b', user_response.lower()))
-        advanced_words = words.intersection(advanced_vocab)
+        advanced_words = self.get_advanced_vocabulary(user_cefr_level, words)
         print("these are the advanced words", advanced_words)
         
         # Calculate the score and scale it to a maximum of 0.5
@@ -346,61 +537,28 @@ class OpenAIChat:
         return advanced_vocab_score
 
 
-    def get_advanced_vocabulary(self, user_cefr_level):
-
-
-        additional_instructions = f"""
-                1.) Use your file_search function to look at only the CEFR files higher than {self.cefr_level}
-                2.) Run the function advanced_word_detector
-            """
-
-        return 'advanced word count returned'
-
-        # advanced_word_detector_event_handler = EventHandler()
-        # with self.client.beta.threads.runs.stream(
-            
-        #         thread_id=self.advanced_word_detector_thread.id,
-        #         assistant_id=self.advanced_word_detector_assistant.id,
-        #         additional_messages=[{"role": "user","content": self.user_response}],
-        #         additional_instructions=additional_instructions,
-        #         event_handler= advanced_word_detector_event_handler,
-                
-
-        # ) as stream:
-        #     stream.until_done()
-        # response_json = json.loads(advanced_word_detector_event_handler.current_response)
-        # print(response_json)
-        # number_of_advanced_words = response_json.get('number_of_advanced_words', 0)
-        # advanced_words_used = response_json.get('advanced_words_used', 0)
-        # print("Number of advanced words used:", number_of_advanced_words )
-        # print("Number of advanced words used:", advanced_words_used )
-        
-        return number_of_advanced_words
+    def get_advanced_vocabulary(self, user_cefr_level, words):
+        # Answered from the local per-level vocabulary index rather than an assistant run
+        return vocabulary_index.words_above_level(self.language, words, user_cefr_level)
 
-    def calculate_response_score(self):
+    @timed('response_scoring')
+    def calculate_response_score(self, bot_response=None, user_response=None):
+        bot_response = self.bot_response if bot_response is None else bot_response
+        user_response = self.user_response if user_response is None else user_response
 
-        response_score_event_handler = EventHandler()
-        with self.client.beta.threads.runs.stream(
-            
-                thread_id=self.response_score_thread.id,
-                assistant_id=self.response_score_assistant.id,
-                additional_messages=[{"role": "user","content": "bot: " + self.bot_response + "user: " + self.user_response}],
-                
-                event_handler= response_score_event_handler,
-        ) as stream:
-            stream.until_done()
-        response_json = json.loads(response_score_event_handler.current_response)
+        try:
+            response_json = self.run_classifier('response_score', "bot: " + bot_response + "user: " + user_response)
+        except RunDeadlineExceeded as e:
+            # No score means the turn is left ungraded
+            print(f"{e}, skipping grading")
+            return None
         response_score = response_json.get('Overall Score', 0)
         print("Response Score:", response_score )
-        
-
-        
-
-        self.bot_response = response_score_event_handler.current_response
         return response_score
 
 
 
+    @timed('english_word_counting')
     def calculate_english_words_score(self, user_response):
         words = re.findall(r'\b\w+\b', user_response.lower())
         print(words)
@@ -411,40 +569,54 @@ class OpenAIChat:
         def count_english_word(user_response):
             
             
-            english_word_counter_event_handler = EventHandler()
-            with self.client.beta.threads.runs.stream(
-                
-                    thread_id=self.english_word_counter_thread.id,
-                    assistant_id=self.english_word_counter_assistant.id,
-                    additional_messages=[{"role": "user","content": user_response }],
-                    event_handler= english_word_counter_event_handler,
-            ) as stream:
-                stream.until_done()
-            
-            response_json = json.loads(english_word_counter_event_handler.current_response)
+            try:
+                response_json = self.run_classifier('english_word_counter', user_response)
+            except RunDeadlineExceeded as e:
+                print(f"{e}, not penalizing English words")
+                return 0
             english_words_number = response_json.get('number_of_english_words', 0)
             print("Number of English Words:", english_words_number)
             return english_words_number
         
 
-        english_words_number = count_english_word(user_response)
-        
+        if ENGLISH_WORD_COUNTER == 'llm':
+            english_words_number = count_english_word(user_response)
+        else:
+            english_words_number = len(english_word_detector.english_words(words, self.language))
+            print("Number of English Words:", english_words_number)
         
         return english_words_number / len(words)
 
+    @timed('misspelling_check')
     def calculate_misspellings_score(self, user_response):
         words = re.findall(r'\b\w+\b', user_response.lower())
+        spell = nlp_resources.spell_lexicon(language_code(self.language))
+        if spell is None:
+            # No dictionary for this language, so there is nothing to count against
+            return 1
         misspellings = spell.unknown(words)
         misspellings_score = max(0, 1 - len(misspellings) / len(words)) if words else 1
         return misspellings_score
 
-    def calculate_overall_performance_score(self, user_response, expected_response):
+    def start_grading(self, user_response, bot_response):
+        # Fan the two grading runs out; they use separate threads so they can overlap
+        return {
+            'response_score': submit_turn_task(self.calculate_response_score, bot_response, user_response),
+            'english_words_penalty': submit_turn_task(self.calculate_english_words_score, user_response),
+        }
+
+    def calculate_overall_performance_score(self, user_response, expected_response, grading=None):
+        if grading is None:
+            grading = self.start_grading(user_response=user_response, bot_response=expected_response)
 
-        response_score = self.calculate_response_score()
+        response_score = join_turn_task(grading['response_score'], 'response score')
+        if response_score is None:
+            # Without a response score there is nothing meaningful to rate
+            return None
 
-        english_words_penalty = self.calculate_english_words_score(user_response)
+        english_words_penalty = join_turn_task(grading['english_words_penalty'], 'english words penalty', default=0)
 
-        advanced_vocab_bonus = self.calculate_advanced_vocab_score(user_response, self.users_cefr_level)
+        advanced_vocab_bonus = self.calculate_advanced_vocab_score(user_response, elo_to_cefr(self.users_rating))
 
 
         print("response score " + str(response_score))
@@ -456,27 +628,141 @@ class OpenAIChat:
         print("final score ", final_score)
         return final_score
 
-    def calculate_updated_rating(self, user_response, expected_response, difficulty_level):
+    def queue_grading(self, user_response, expected_response, difficulty_level):
+        with self.rating_condition:
+            self.pending_gradings += 1
+            epoch = self.grading_epoch
+        scoring_worker.submit(self, self._run_grading, user_response, expected_response, difficulty_level, epoch)
+
+    def _run_grading(self, user_response, expected_response, difficulty_level, epoch):
+        try:
+            self.calculate_updated_rating(user_response=user_response, expected_response=expected_response, difficulty_level=difficulty_level, epoch=epoch)
+        finally:
+            with self.rating_condition:
+                self.pending_gradings -= 1
+                self.rating_version += 1
+                self.rating_condition.notify_all()
+
+    def wait_for_rating(self, timeout=None):
+        # Blocks until every queued grading has been applied, or the timeout passes
+        with self.rating_condition:
+            self.rating_condition.wait_for(lambda: self.pending_gradings == 0, timeout=timeout)
+            return self.users_rating, self.pending_gradings
+
+    def calculate_updated_rating(self, user_response, expected_response, difficulty_level, grading=None, epoch=None):
         # Example evaluation logic
-        performance_score = self.calculate_overall_performance_score(user_response=user_response, expected_response=expected_response)  # Assume perfect performance for demonstration
-        
+        performance_score = self.calculate_overall_performance_score(user_response=user_response, expected_response=expected_response, grading=grading)  # Assume perfect performance for demonstration
+        if performance_score is None:
+            print("Skipping rating update, grading did not finish in time")
+            return
+
+        with self.rating_condition:
+            if epoch is not None and epoch != self.grading_epoch:
+                print("Chat was reset, dropping stale rating update")
+                return
+            self._apply_rating_update(performance_score, difficulty_level)
+        self.save_state()
+
+    @timed('elo_update')
+    def _apply_rating_update(self, performance_score, difficulty_level):
 
         user_rating = self.users_rating
-        expected_score = 1 / (1 + 10 ** ((difficulty_level - user_rating) / 400))
-        
+
         # Elo rating adjustment
-        k = 5
-        new_rating = user_rating + k * (performance_score - expected_score)
-        print("change in elo ", str(k * (performance_score - expected_score)))
-        if new_rating < 0:
-            new_rating = 0
-        self.users_rating = int(new_rating)
+        print("change in elo ", str(float(elo.rating_change(user_rating, performance_score, difficulty_level, ELO_K))))
+        self.users_rating = int(elo.update_ratings(user_rating, performance_score, difficulty_level, ELO_K))
+        self._state_delta['users_rating'] += self.users_rating - user_rating
         print(f"Updated Rating: {self.users_rating}")
 
 
 
 
-chat1 = OpenAIChat(api_key=api_key)
+# Retrieve the assistants once at startup instead of per chat
+warm_assistants(api_key)
+
+# Threads the classifier assistants run on only ever see one-off inputs, so they are
+# not saved with the learner's state and are deleted when the session leaves memory.
+# The tutor's thread is the conversation and outlives the in-memory session.
+SCRATCH_THREAD_ROLES = ("advanced_word_detector_thread", "english_word_counter_thread",
+                        "response_score_thread", "help_detector_thread", "mistake_detector_thread")
+
+# Which engine serves each role: 'assistants' (threads and runs) or 'chat' (chat
+# completions with the conversation kept here), e.g. ENGINE_TUTOR=chat
+ENGINE_NAMES = {role: os.getenv(f'ENGINE_{role.upper()}', 'assistants') for role in ENGINE_ROLES}
+
+POOLED_THREAD_ROLES = [f"{role}_thread" for role in ("help_detector", "response_score") if ENGINE_NAMES[role] == 'assistants']
+if ENGINE_NAMES['tutor'] == 'assistants':
+    POOLED_THREAD_ROLES.insert(0, "thread")
+if ENGLISH_WORD_COUNTER == 'llm' and ENGINE_NAMES['english_word_counter'] == 'assistants':
+    POOLED_THREAD_ROLES.append("english_word_counter_thread")
+
+# Pre-created threads for the roles every session uses, so new learners skip the
+# threads.create round trips; THREAD_POOL_SIZE=0 creates them inline as before
+thread_pool = AssistantThreadPool(
+    get_client(api_key),
+    roles=POOLED_THREAD_ROLES,
+    size=int(os.getenv('THREAD_POOL_SIZE', 8)),
+    refill_interval=float(os.getenv('THREAD_POOL_REFILL_INTERVAL', 30)),
+).start()
+registry.add_collector(thread_pool.metric_lines)
+
+# Every assistant run goes through run_executor: per-role deadlines (RUN_DEADLINE_<ROLE>),
+# jittered retries paid for from a shared budget, and hedged runs for the cheap classifiers.
+# Its threads each hold one run open, so by default there is one per allowed in-flight
+# run plus as many again for hedges and the cancels of the runs they beat (RUN_WORKERS).
+run_executor = RunExecutor(
+    get_client(api_key),
+    thread_pool,
+    deadlines=parse_deadlines(),
+    hedge_roles=[role for role in os.getenv('RUN_HEDGE_ROLES', 'help_detector,response_score,english_word_counter').split(',') if role],
+    max_attempts=int(os.getenv('RUN_MAX_ATTEMPTS', 3)),
+    default_hedge_delay=float(os.getenv('RUN_HEDGE_DELAY', 2.0)),
+    budget=RetryBudget(ratio=float(os.getenv('RUN_RETRY_BUDGET_RATIO', 0.1))),
+    max_workers=int(os.getenv('RUN_WORKERS', 2 * ENDPOINT_CONCURRENCY['runs'])),
+)
+
+engines = {
+    'assistants': AssistantsEngine(run_executor),
+    'chat': ChatCompletionsEngine(
+        run_executor,
+        vocabulary_index,
+        model=os.getenv('CHAT_MODEL', 'gpt-4o-mini'),
+        vocabulary_words=int(os.getenv('CHAT_VOCABULARY_WORDS', 400)),
+    ),
+}
+role_engines = {role: engines[name] for role, name in ENGINE_NAMES.items()}
+
+# Learner state survives restarts and is shared by every worker through the store.
+# Sessions read it when they are created, and again before a turn if another
+# worker has saved a newer version; they write back in batches.
+state_store = open_state_store(os.getenv('STATE_STORE', 'sqlite:///converso_state.db'))
+state_writer = StateWriter(state_store, flush_interval=float(os.getenv('STATE_FLUSH_INTERVAL', 1.0)))
+
+def load_chat(session_id, chat_class=None):
+    chat = (chat_class or OpenAIChat)(api_key=api_key)
+    chat.session_id = session_id
+    state, chat.state_version = state_store.load(session_id)
+    if state is not None:
+        chat.load_state(state)
+    chat.state_writer = state_writer
+    return chat
+
+def finish_evicted_chat(chat):
+    # Runs after the chat's pending gradings, so the saved state has their scores
+    chat.save_state()
+    chat.evicted = True
+    chat.release_threads(SCRATCH_THREAD_ROLES)
+    skill_tracker.remove(chat.skill_key)
+
+def evict_chat(session):
+    scoring_worker.submit(session.chat, finish_evicted_chat, session.chat)
+
+sessions = SessionManager(
+    chat_factory=load_chat,
+    capacity=int(os.getenv('MAX_SESSIONS', 1000)),
+    idle_ttl=float(os.getenv('SESSION_IDLE_TTL', 1800)),
+    on_evict=evict_chat,
+)
 
 topics_to_practice_list = [   "general conversation", "introductions",
     "weather",
@@ -488,6 +774,11 @@ topics_to_practice_list = [   "general conversation", "introductions",
     "food"]
 
 
+def get_session_id(data):
+    # Older clients don't send an id; they all share the 'default' session as before
+    return str(data.get('session_id') or request.headers.get('X-Session-ID') or 'default')
+
+
 @app.route('/set-up-chat', methods=['POST'])
 def set_up_chat():
 
@@ -502,13 +793,17 @@ def set_up_chat():
     users_rating = data.get('users_rating', 300)  # Default to 300 if not provided
     language = data.get('language', 'Spanish')
 
-    # Set the chat topic
-    chat1.set_chat_topic(conversation_topic)
-    chat1.set_language(language)
-    chat1.set_users_rating(300)
-    
-    # Update the user's rating
-    chat1.users_rating = int(users_rating)
+    with sessions.locked(get_session_id(data)) as session:
+        chat = session.chat
+        chat.sync_state()
+        # Set the chat topic
+        chat.set_chat_topic(conversation_topic)
+        chat.set_language(language)
+        chat.set_users_rating(300)
+
+        # Update the user's rating
+        chat.users_rating = int(users_rating)
+        chat.save_state()
     return 'Chat Set Up'
 
 @app.route('/generate-response', methods=['POST'])
@@ -521,8 +816,13 @@ def generate_response():
     messagesList = data.get('messages')
     conversation_topic = data.get('conversation_topic')
     users_rating = data.get('users_rating')
-    
-    bots_response, users_rating = chat1.send_message(user_input)
+
+    with sessions.locked(get_session_id(data)) as session:
+        session.chat.sync_state()
+        try:
+            bots_response, users_rating = session.chat.send_message(user_input)
+        except RunDeadlineExceeded as e:
+            return jsonify({'error': str(e)}), 504
         
 
 
@@ -536,11 +836,107 @@ def generate_response():
     # return jsonify({'data': response.choices[0].message.content.strip()})
     return jsonify({'data': bots_response, 'users_rating': users_rating})
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+def format_sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+@app.route('/generate-response-stream', methods=['POST'])
+def generate_response_stream():
+    # Same turn as /generate-response, but the tutor reply is sent as server-sent
+    # events: one 'delta' per token chunk, then a 'done' event with the rating
+    data = request.get_json()
+    user_input = data.get('input')
+    session_id = get_session_id(data)
+    events = queue.Queue()
+
+    def run_turn():
+        try:
+            with sessions.locked(session_id) as session:
+                session.chat.sync_state()
+                bots_response, users_rating = session.chat.send_message(
+                    user_input, on_delta=lambda text: events.put(('delta', {'delta': text}))
+                )
+            # The reply is already out, so waiting for this turn's grade costs no latency
+            users_rating, pending = session.chat.wait_for_rating(timeout=SCORING_TIMEOUT)
+            events.put(('done', {'data': bots_response, 'users_rating': users_rating}))
+        except Exception as e:
+            print(f"Streaming turn failed: {e}")
+            events.put(('error', {'message': str(e)}))
+        finally:
+            events.put(None)
+
+    threading.Thread(target=run_turn, daemon=True).start()
+
+    def event_stream():
+        while True:
+            event = events.get()
+            if event is None:
+                break
+            yield format_sse(*event)
+
+    return Response(event_stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def parse_wait(data):
+    # Seconds /users-rating may block, clamped to [0, SCORING_TIMEOUT]; None when not a number
+    try:
+        wait = float(data.get('wait', 0))
+    except (TypeError, ValueError):
+        return None
+    if math.isnan(wait):
+        return None
+    return min(max(wait, 0.0), SCORING_TIMEOUT)
+
+def stored_rating(session_id):
+    # For a session this worker does not hold: the rating last saved to the store.
+    # Its gradings ran elsewhere, so none are pending here. None when never saved.
+    state, _ = state_store.load(session_id)
+    if state is None:
+        return None
+    return {'users_rating': state.get('users_rating'), 'pending': 0, 'version': 0}
+
+@app.route('/users-rating', methods=['POST'])
+def users_rating():
+    # Grading finishes after /generate-response returns; poll here for the result.
+    # Pass 'wait' (seconds) to block until pending gradings have been applied.
+    data = request.get_json(silent=True) or {}
+    wait = parse_wait(data)
+    if wait is None:
+        return jsonify({'message': "'wait' must be a number of seconds."}), 400
+    session_id = get_session_id(data)
+    session = sessions.peek(session_id)
+    if session is None:
+        rating = stored_rating(session_id)
+        if rating is None:
+            return jsonify({'message': 'Chat has not been set up.'}), 404
+        return jsonify(rating), 200
+    chat = session.chat
+    users_rating, pending = chat.wait_for_rating(timeout=wait)
+    return jsonify({'users_rating': users_rating, 'pending': pending, 'version': chat.rating_version}), 200
+
+@app.route('/help-classifier-stats', methods=['GET'])
+def help_classifier_stats():
+    return jsonify(help_classifier.stats()), 200
+
 @app.route('/reset-chat', methods=['POST'])
 def reset_chat():
-    chat1.reset_chat()
+    data = request.get_json(silent=True) or {}
+    with sessions.locked(get_session_id(data), create=False) as session:
+        if session is not None:
+            session.chat.sync_state()
+            session.chat.reset_chat()
     return jsonify({'message': 'Chat has been reset.'}), 200
 
+@app.route('/ready', methods=['GET'])
+def ready():
+    # Load balancer readiness probe: only route traffic here once the NLP resources are warm
+    status = {'ready': nlp_resources.is_ready(), 'loaded': nlp_resources.loaded()}
+    if nlp_resources.warm_up_error:
+        status['error'] = nlp_resources.warm_up_error
+    return jsonify(status), 200 if status['ready'] else 503
+
 @app.route('/check-server', methods=['GET'])
 def check_server():
     server_info = request.environ.get('SERVER_SOFTWARE', 'Unknown')
@@ -549,4 +945,3 @@ def check_server():
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5001, debug=True)
 
-
@@ -0,0 +1,184 @@
+import asyncio
+import contextlib
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class Session:
+    def __init__(self, session_id, chat):
+        self.session_id = session_id
+        self.chat = chat
+        # Held for the duration of a request so one learner's turns never interleave.
+        # A plain Lock: the ASGI server may acquire it on one thread and release it on another
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        # Set under the lock once the session is torn down; its chat must not serve another turn
+        self.evicted = False
+
+    def touch(self):
+        self.last_used = time.monotonic()
+
+    @contextlib.asynccontextmanager
+    async def async_locked(self):
+        # The same lock for turns awaited on the event loop, waited for off the loop
+        if not self.lock.acquire(blocking=False):
+            acquiring = asyncio.ensure_future(asyncio.to_thread(self.lock.acquire))
+            try:
+                await asyncio.shield(acquiring)
+            except asyncio.CancelledError:
+                # The waiting thread may still get the lock; hand it straight back
+                acquiring.add_done_callback(lambda future: future.cancelled() or self.lock.release())
+                raise
+        try:
+            yield
+        finally:
+            self.lock.release()
+
+
+class SessionManager:
+    # Keeps one OpenAIChat per session id, evicting the least recently used
+    # session when full and any session idle for longer than idle_ttl seconds.
+    # chat_factory(session_id) builds the chat for a session not yet in memory;
+    # it runs outside the manager's lock, so one slow cold start only holds up
+    # requests for that same session. on_evict runs on a background thread.
+    def __init__(self, chat_factory, capacity=1000, idle_ttl=1800, on_evict=None):
+        self.chat_factory = chat_factory
+        self.capacity = capacity
+        self.idle_ttl = idle_ttl
+        self.on_evict = on_evict
+        self._sessions = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+        self._evictions = queue.Queue()
+        self._evictor = None
+
+    def get(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+                session.touch()
+                evicted = self._expire_locked()
+            else:
+                # The first request for a session builds it; others wait on the same future
+                loading = self._loading.get(session_id)
+                building = loading is None
+                if building:
+                    loading = self._loading[session_id] = Future()
+        if session is not None:
+            self._evict(evicted)
+            return session
+        if not building:
+            return loading.result()
+
+        try:
+            session = Session(session_id, self.chat_factory(session_id))
+        except BaseException as e:
+            with self._lock:
+                del self._loading[session_id]
+            loading.set_exception(e)
+            raise
+        with self._lock:
+            del self._loading[session_id]
+            self._sessions[session_id] = session
+            session.touch()
+            evicted = self._expire_locked()
+        loading.set_result(session)
+        self._evict(evicted)
+        return session
+
+    def peek(self, session_id):
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    @contextlib.contextmanager
+    def locked(self, session_id, create=True):
+        # get(), or peek() when create is False, with the session's lock held for the
+        # block. A session evicted while we waited for its lock is looked up again, so
+        # the block never runs on a torn-down chat. Yields None when peek() misses.
+        while True:
+            session = self.get(session_id) if create else self.peek(session_id)
+            if session is None:
+                yield None
+                return
+            with session.lock:
+                if not session.evicted:
+                    yield session
+                    return
+
+    @contextlib.asynccontextmanager
+    async def async_locked(self, session_id, create=True):
+        # locked() for the event loop; a cold session is built off the loop
+        while True:
+            session = await asyncio.to_thread(self.get, session_id) if create else self.peek(session_id)
+            if session is None:
+                yield None
+                return
+            async with session.async_locked():
+                if not session.evicted:
+                    yield session
+                    return
+
+    def remove(self, session_id):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is not None:
+            self._evict([session])
+        return session
+
+    def expire(self):
+        with self._lock:
+            evicted = self._expire_locked()
+        self._evict(evicted)
+        return len(evicted)
+
+    def _expire_locked(self):
+        evicted = []
+        now = time.monotonic()
+        # Oldest entries are at the front, so stop at the first one still fresh
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_used <= self.idle_ttl:
+                break
+            evicted.append(self._sessions.pop(session_id))
+        while len(self._sessions) > self.capacity:
+            evicted.append(self._sessions.popitem(last=False)[1])
+        return evicted
+
+    def _evict(self, sessions):
+        if self.on_evict is None or not sessions:
+            return
+        with self._lock:
+            if self._evictor is None:
+                self._evictor = threading.Thread(target=self._run_evictions, name='session-evictor', daemon=True)
+                self._evictor.start()
+        for session in sessions:
+            self._evictions.put(session)
+
+    def _run_evictions(self):
+        while True:
+            session = self._evictions.get()
+            try:
+                # Wait for any in-flight turn to finish before tearing the session down
+                with session.lock:
+                    session.evicted = True
+                    self.on_evict(session)
+            except Exception as e:
+                print(f"Evicting session {session.session_id} failed: {e}")
+            finally:
+                self._evictions.task_done()
+
+    def join_evictions(self):
+        # Blocks until every eviction queued so far has run; for shutdown and tests
+        self._evictions.join()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def __contains__(self, session_id):
+        with self._lock:
+            return session_id in self._sessions
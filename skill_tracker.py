@@ -0,0 +1,190 @@
+import threading
+import time
+
+import numpy as np
+
+# Grammar topics the mistake detector reports, in matrix row order
+GRAMMAR_TOPICS = (
+    "Present Tense Verbs",
+    "Preterite Tense",
+    "Imperfect Tense",
+    "Future Tense",
+    "Conditional Tense",
+    "Subjunctive Mood",
+    "Reflexive Verbs",
+    "Commands (Imperatives)",
+    "Possessive Adjectives",
+    "Possessive Pronouns",
+    "Direct Object Pronouns",
+    "Indirect Object Pronouns",
+    "Double Object Pronouns",
+    "Gustar and Similar Verbs",
+    "Ser vs. Estar",
+    "Por vs. Para",
+    "Comparatives and Superlatives",
+    "Demonstrative Adjectives",
+    "Demonstrative Pronouns",
+    "Interrogative Words",
+    "Negative Words",
+    "Adverbs",
+    "Prepositions",
+    "Articles",
+    "Gender and Number Agreement",
+    "Noun-Adjective Agreement",
+    "Sentence Structure",
+    "Questions and Exclamations",
+    "Passive Voice",
+    "Relative Pronouns",
+    "Conditional Sentences",
+    "Idiomatic Expressions",
+    "Numbers",
+    "Time Expressions",
+    "Conjunctions",
+    "Gerunds and Present Participles",
+    "Infinitives",
+    "Future Perfect",
+    "Past Perfect (Pluperfect)",
+    "Imperfect Subjunctive",
+)
+
+DECAY_FACTOR = 0.8
+# A topic at or above this many recent mistakes gets a lesson recommended, and stops decaying
+RECOMMEND_THRESHOLD = 10
+
+
+class SkillTracker:
+    # Mistake scores for every learner in one topics x learners float32 matrix.
+    # Scores decay by decay_factor per decay_interval seconds, applied lazily to
+    # a learner's column when it is next read or written, so idle learners cost
+    # nothing; bulk reads decay every column in one vectorized pass.
+    def __init__(self, topics=GRAMMAR_TOPICS, decay_factor=DECAY_FACTOR, decay_interval=300,
+                 threshold=RECOMMEND_THRESHOLD, capacity=1024):
+        self.topics = tuple(topics)
+        self.decay_factor = decay_factor
+        self.decay_interval = decay_interval
+        self.threshold = threshold
+        self._topic_index = {topic: index for index, topic in enumerate(self.topics)}
+        self._scores = np.zeros((len(self.topics), capacity), dtype=np.float32)
+        self._decayed_at = np.zeros(capacity, dtype=np.float64)
+        self._columns = {}
+        self._free = list(range(capacity - 1, -1, -1))
+        self._lock = threading.Lock()
+
+    def record(self, learner_id, mistakes, now=None):
+        # One turn's mistakes; a topic named twice counts twice, unknown topics are ignored
+        rows = [self._topic_index[topic] for topic in mistakes if topic in self._topic_index]
+        with self._lock:
+            column = self._column(learner_id)
+            self._decay([column], now)
+            np.add.at(self._scores[:, column], rows, 1)
+
+    def record_counts(self, learner_ids, counts, now=None):
+        # Bulk update: counts is a topics x len(learner_ids) array of new mistakes
+        counts = np.asarray(counts, dtype=np.float32)
+        with self._lock:
+            columns = np.array([self._column(learner_id) for learner_id in learner_ids], dtype=np.int64)
+            self._decay(columns, now)
+            # Columns are unique per learner, but a learner may be listed twice
+            np.add.at(self._scores, (slice(None), columns), counts)
+
+    def scores(self, learner_id, now=None):
+        with self._lock:
+            column = self._columns.get(learner_id)
+            if column is None:
+                return dict.fromkeys(self.topics, 0.0)
+            self._decay([column], now)
+            return dict(zip(self.topics, self._scores[:, column].tolist()))
+
+    def snapshot(self, learner_id, now=None):
+        # (scores, time they were decayed to), to save and later pass back to load()
+        now = time.time() if now is None else now
+        return self.scores(learner_id, now), now
+
+    def load(self, learner_id, scores, now=None):
+        # Restores a learner from the dict scores() returned, e.g. from saved state;
+        # now is when those scores were decayed to, so decay carries on from there
+        with self._lock:
+            column = self._column(learner_id)
+            self._scores[:, column] = 0
+            for topic, value in scores.items():
+                if topic in self._topic_index:
+                    self._scores[self._topic_index[topic], column] = value
+            self._decayed_at[column] = time.time() if now is None else now
+
+    def recommend(self, learner_id, k=1, now=None):
+        # Up to k topics at or above the threshold, most frequent mistakes first
+        with self._lock:
+            column = self._columns.get(learner_id)
+            if column is None:
+                return []
+            self._decay([column], now)
+            return self._top_topics(self._scores[:, column], k)
+
+    def recommend_all(self, k=1, now=None):
+        # {learner_id: topics} for every learner with at least one topic over the threshold
+        with self._lock:
+            learner_ids = list(self._columns)
+            columns = np.array([self._columns[learner_id] for learner_id in learner_ids], dtype=np.int64)
+            if not columns.size:
+                return {}
+            self._decay(columns, now)
+            scores = self._scores[:, columns]
+        k = min(k, len(self.topics))
+        top = np.argpartition(-scores, k - 1, axis=0)[:k]
+        top_scores = np.take_along_axis(scores, top, axis=0)
+        order = np.argsort(-top_scores, axis=0, kind='stable')
+        top, top_scores = np.take_along_axis(top, order, axis=0), np.take_along_axis(top_scores, order, axis=0)
+        recommendations = {}
+        for index in np.flatnonzero(top_scores[0] >= self.threshold):
+            recommendations[learner_ids[index]] = [self.topics[row] for row, score in zip(top[:, index], top_scores[:, index]) if score >= self.threshold]
+        return recommendations
+
+    def struggling_counts(self, now=None):
+        # Learners at or over the threshold per topic, for analytics across all sessions
+        with self._lock:
+            columns = np.array(list(self._columns.values()), dtype=np.int64)
+            if not columns.size:
+                return dict.fromkeys(self.topics, 0)
+            self._decay(columns, now)
+            counts = (self._scores[:, columns] >= self.threshold).sum(axis=1)
+        return dict(zip(self.topics, counts.tolist()))
+
+    def remove(self, learner_id):
+        with self._lock:
+            column = self._columns.pop(learner_id, None)
+            if column is not None:
+                self._scores[:, column] = 0
+                self._free.append(column)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._columns)
+
+    def _column(self, learner_id):
+        column = self._columns.get(learner_id)
+        if column is None:
+            if not self._free:
+                self._grow()
+            column = self._columns[learner_id] = self._free.pop()
+            self._decayed_at[column] = time.time()
+        return column
+
+    def _grow(self):
+        capacity = self._scores.shape[1]
+        self._scores = np.concatenate([self._scores, np.zeros_like(self._scores)], axis=1)
+        self._decayed_at = np.concatenate([self._decayed_at, np.zeros(capacity)])
+        self._free.extend(range(2 * capacity - 1, capacity - 1, -1))
+
+    def _decay(self, columns, now=None):
+        now = time.time() if now is None else now
+        columns = np.asarray(columns, dtype=np.int64)
+        factors = self.decay_factor ** (np.maximum(now - self._decayed_at[columns], 0) / self.decay_interval)
+        block = self._scores[:, columns]
+        self._scores[:, columns] = np.where(block >= self.threshold, block, block * factors.astype(np.float32))
+        self._decayed_at[columns] = now
+
+    def _top_topics(self, scores, k):
+        k = min(k, len(self.topics))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [self.topics[row] for row in top if scores[row] >= self.threshold]
@@ -0,0 +1,244 @@
+import abc
+import atexit
+import json
+import sqlite3
+import threading
+import time
+
+
+class StateStore(abc.ABC):
+    # Where learner state lives between requests and restarts. Every saved state
+    # has a version, bumped on each write, so workers sharing a store can tell
+    # when another one has written since they last read. load() returns
+    # (state, version), or (None, 0) for a new session. save_many() writes a
+    # batch of {session_id: (state, expected_version)} at once: a row is only
+    # written if its stored version is still the expected one (None skips the
+    # check), and the result maps each session to its new version, or None when
+    # another writer got there first.
+    @abc.abstractmethod
+    def load(self, session_id):
+        pass
+
+    @abc.abstractmethod
+    def version(self, session_id):
+        pass
+
+    @abc.abstractmethod
+    def save_many(self, states):
+        pass
+
+    def close(self):
+        pass
+
+
+class MemoryStateStore(StateStore):
+    # Keeps state for the life of the process only; useful for local runs
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def load(self, session_id):
+        with self._lock:
+            state, version = self._states.get(session_id, (None, 0))
+        return (json.loads(state) if state is not None else None), version
+
+    def version(self, session_id):
+        with self._lock:
+            return self._states.get(session_id, (None, 0))[1]
+
+    def save_many(self, states):
+        saved = {}
+        with self._lock:
+            for session_id, (state, expected_version) in states.items():
+                version = self._states.get(session_id, (None, 0))[1]
+                if expected_version is not None and version != expected_version:
+                    saved[session_id] = None
+                    continue
+                self._states[session_id] = (json.dumps(state), version + 1)
+                saved[session_id] = version + 1
+        return saved
+
+
+class SQLiteStateStore(StateStore):
+    # One row of JSON per session. WAL mode lets every worker process read while
+    # one of them writes a batch.
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS learner_state ("
+                "session_id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL, "
+                "version INTEGER NOT NULL DEFAULT 0)"
+            )
+            columns = [row[1] for row in self._connection.execute("PRAGMA table_info(learner_state)")]
+            if 'version' not in columns:
+                # Databases written before states were versioned
+                self._connection.execute("ALTER TABLE learner_state ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            self._connection.commit()
+
+    def load(self, session_id):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT state, version FROM learner_state WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return (json.loads(row[0]), row[1]) if row else (None, 0)
+
+    def version(self, session_id):
+        with self._lock:
+            row = self._connection.execute("SELECT version FROM learner_state WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    def save_many(self, states):
+        now = time.time()
+        saved = {}
+        with self._lock:
+            with self._connection:
+                for session_id, (state, expected_version) in states.items():
+                    state = json.dumps(state)
+                    if expected_version is None:
+                        self._connection.execute(
+                            "INSERT INTO learner_state (session_id, state, updated_at, version) VALUES (?, ?, ?, 1) "
+                            "ON CONFLICT(session_id) DO UPDATE SET state = excluded.state, "
+                            "updated_at = excluded.updated_at, version = learner_state.version + 1",
+                            (session_id, state, now),
+                        )
+                        saved[session_id] = self._connection.execute(
+                            "SELECT version FROM learner_state WHERE session_id = ?", (session_id,)
+                        ).fetchone()[0]
+                        continue
+                    if expected_version == 0:
+                        cursor = self._connection.execute(
+                            # Rows saved before states were versioned are still at version 0
+                            "INSERT INTO learner_state (session_id, state, updated_at, version) VALUES (?, ?, ?, 1) "
+                            "ON CONFLICT(session_id) DO UPDATE SET state = excluded.state, "
+                            "updated_at = excluded.updated_at, version = 1 WHERE learner_state.version = 0",
+                            (session_id, state, now),
+                        )
+                    else:
+                        cursor = self._connection.execute(
+                            "UPDATE learner_state SET state = ?, updated_at = ?, version = version + 1 "
+                            "WHERE session_id = ? AND version = ?",
+                            (state, now, session_id, expected_version),
+                        )
+                    saved[session_id] = expected_version + 1 if cursor.rowcount else None
+        return saved
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def open_state_store(url):
+    # 'sqlite:///path/to.db' or 'memory'
+    if url == 'memory':
+        return MemoryStateStore()
+    if url.startswith('sqlite:///'):
+        return SQLiteStateStore(url[len('sqlite:///'):])
+    raise ValueError(f"Unsupported STATE_STORE: {url}")
+
+
+class StateWriter:
+    # Write-behind buffer in front of a StateStore. schedule() only records the
+    # latest state per session; a background thread writes everything pending in
+    # one transaction every flush_interval seconds, so a burst of rating and
+    # tracker updates for a session costs a single row write.
+    #
+    # The owner passed to schedule() is the object the state came from. Its
+    # state_version is sent as the expected version and advanced after each
+    # write. A delta can ride along with the state: whatever incremental changes
+    # it carries (rating and mistake counts, for a chat). If another worker wrote
+    # first, the write is dropped and owner.state_conflicted(deltas) gets back
+    # every delta that write carried, to apply on top of the newer state.
+    def __init__(self, store, flush_interval=1.0, max_pending=500):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='state-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def schedule(self, session_id, state, owner=None, delta=None):
+        with self._lock:
+            expected_version = owner.state_version if owner is not None else None
+            deltas = [delta] if delta is not None else []
+            superseded = self._pending.get(session_id)
+            if superseded is not None and superseded[2] is owner:
+                # The newer state includes the older one's changes; keep its deltas in case both are refused
+                deltas = superseded[3] + deltas
+                superseded = None
+            self._pending[session_id] = (state, expected_version, owner, deltas)
+            full = len(self._pending) >= self.max_pending
+        if superseded is not None:
+            self._conflicted(session_id, superseded)
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            saved = self.store.save_many({
+                session_id: (state, expected_version) for session_id, (state, expected_version, owner, deltas) in pending.items()
+            })
+        except Exception as e:
+            print(f"Saving learner state failed: {e}")
+            # Put the batch back unless newer state has been scheduled since
+            superseded = []
+            with self._lock:
+                for session_id, entry in pending.items():
+                    queued = self._pending.get(session_id)
+                    if queued is None:
+                        self._pending[session_id] = entry
+                    elif queued[2] is entry[2]:
+                        self._pending[session_id] = queued[:3] + (entry[3] + queued[3],)
+                    else:
+                        superseded.append((session_id, entry))
+            for session_id, entry in superseded:
+                self._conflicted(session_id, entry)
+            return 0
+        conflicts = []
+        with self._lock:
+            for session_id, entry in pending.items():
+                state, expected_version, owner, deltas = entry
+                version = saved.get(session_id)
+                if owner is None:
+                    continue
+                if version is None:
+                    conflicts.append((session_id, entry))
+                    continue
+                # Skip owners that have reloaded a newer state since scheduling this one
+                if owner.state_version != expected_version:
+                    continue
+                owner.state_version = version
+                # State the owner scheduled during the write was based on the version just replaced
+                queued = self._pending.get(session_id)
+                if queued is not None and queued[2] is owner and queued[1] == expected_version:
+                    self._pending[session_id] = (queued[0], version, owner, queued[3])
+        for session_id, entry in conflicts:
+            self._conflicted(session_id, entry)
+        return sum(version is not None for version in saved.values())
+
+    def _conflicted(self, session_id, entry):
+        state, expected_version, owner, deltas = entry
+        if owner is None:
+            return
+        print(f"Learner state for {session_id} was saved elsewhere first; re-applying this write's changes")
+        try:
+            owner.state_conflicted(deltas)
+        except Exception as e:
+            print(f"Re-applying learner state changes for {session_id} failed: {e}")
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
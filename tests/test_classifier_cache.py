@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+from classifier_cache import MISS, ClassifierCache, SharedCacheStore, cache_lookups, normalize_input
+
+
+def test_normalize_input_ignores_case_spacing_and_edge_punctuation():
+    assert normalize_input("  ¿No   ENTIENDO?! ") == normalize_input("no entiendo") == "no entiendo"
+
+
+def test_hit_after_put_and_miss_for_other_assistants():
+    cache = ClassifierCache()
+    cache.put('asst_a', "No entiendo", {'user_asking_for_help': 'yes'})
+    assert cache.get('asst_a', "no entiendo!", role='test_hit') == {'user_asking_for_help': 'yes'}
+    assert cache.get('asst_b', "no entiendo", role='test_hit') is MISS
+    assert cache.hit_rate('test_hit') == 0.5
+
+
+def test_entries_expire_after_the_ttl():
+    cache = ClassifierCache(ttl=0.05)
+    cache.put('asst', "hola", {'n': 1})
+    time.sleep(0.1)
+    assert cache.get('asst', "hola") is MISS
+
+
+def test_least_recently_used_entry_is_dropped_when_full():
+    cache = ClassifierCache(max_size=2)
+    cache.put('asst', "uno", 1)
+    cache.put('asst', "dos", 2)
+    cache.get('asst', "uno")
+    cache.put('asst', "tres", 3)
+    assert cache.get('asst', "dos") is MISS
+    assert cache.get('asst', "uno") == 1 and cache.get('asst', "tres") == 3
+
+
+def test_async_compute_runs_once_per_input():
+    cache = ClassifierCache()
+    calls = []
+
+    async def classify():
+        calls.append(1)
+        return {'user_asking_for_help': 'no'}
+
+    for text in ("Hola", "hola!"):
+        assert asyncio.run(cache.get_or_compute_async('asst', text, classify)) == {'user_asking_for_help': 'no'}
+    assert len(calls) == 1
+
+
+def test_shared_store_answers_another_workers_cache(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    first = ClassifierCache(shared_store=SharedCacheStore(path))
+    second = ClassifierCache(shared_store=SharedCacheStore(path))
+    first.put('asst', "qué significa", {'user_asking_for_help': 'yes'})
+    assert second.get('asst', "Qué significa?", role='test_shared') == {'user_asking_for_help': 'yes'}
+    assert cache_lookups.value(role='test_shared', result='shared_hit') == 1
+    # Now held in the second worker's own LRU as well
+    assert second.get('asst', "qué significa", role='test_shared') == {'user_asking_for_help': 'yes'}
+    assert cache_lookups.value(role='test_shared', result='hit') == 1
+
+
+def test_shared_store_prunes_expired_rows(tmp_path):
+    store = SharedCacheStore(str(tmp_path / 'cache.db'), prune_every=3)
+    now = time.time()
+    store.put('old', 1, now - 10)
+    store.put('fresh', 2, now + 60)
+    assert store.get('old') is MISS
+    # The third put triggers a prune
+    store.put('other', 3, now + 60)
+    rows = store._connection.execute("SELECT key FROM classifier_cache ORDER BY key").fetchall()
+    assert rows == [('fresh',), ('other',)]
+    store.put('stale', 4, now - 1)
+    assert store.prune() == 1
+
+
+def test_metric_lines_report_each_role():
+    cache = ClassifierCache()
+    cache.get('asst', "nada", role='test_metrics')
+    lines = cache.metric_lines()
+    assert 'converso_classifier_cache_hit_rate{role="test_metrics"} 0.0' in lines
+    assert {'role': 'test_metrics', 'result': 'miss'} in cache_lookups.labelsets()
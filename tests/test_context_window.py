@@ -0,0 +1,80 @@
+from context_window import (
+    MESSAGE_OVERHEAD_TOKENS, SUMMARY_LINE_CHARS, ConversationContext, estimate_tokens, parse_token_budgets,
+)
+
+
+def message_of(tokens):
+    # Content that estimate_tokens counts as exactly `tokens` tokens, overhead included
+    return "x" * (4 * (tokens - MESSAGE_OVERHEAD_TOKENS - 1))
+
+
+def test_parse_token_budgets_overrides_defaults():
+    budgets = parse_token_budgets(" a1=800, B2=2400 ,")
+    assert budgets["A1"] == 800 and budgets["B2"] == 2400 and budgets["C2"] == 3000
+
+
+def test_short_conversations_are_sent_whole():
+    context = ConversationContext()
+    context.append("user", "hola")
+    context.append("assistant", "¡Hola! ¿Qué tal?")
+    window, summary = context.build("A1")
+    assert [message["content"] for message in window] == ["hola", "¡Hola! ¿Qué tal?"]
+    assert summary == ""
+
+
+def test_older_turns_are_folded_into_the_summary():
+    context = ConversationContext(budgets={"A1": 100})
+    for index in range(5):
+        context.append("user" if index % 2 == 0 else "assistant", f"{index} " + "hola " * 30)
+    window, summary = context.build("A1")
+    assert [message["content"][0] for message in window] == ["3", "4"]
+    assert [line.split()[:2] for line in context.summary_lines] == [["user:", "0"], ["assistant:", "1"], ["user:", "2"]]
+    assert summary == " ".join(context.summary_lines)
+    # Folded messages are gone for good; the next build only sees the window
+    assert len(context.messages) == 2
+
+
+def test_newest_message_is_kept_even_over_budget():
+    context = ConversationContext(budgets={"A1": 10})
+    context.append("user", message_of(50))
+    window, _ = context.build("A1")
+    assert len(window) == 1
+
+
+def test_summary_lines_are_clipped_and_bounded():
+    context = ConversationContext(budgets={"A1": 1}, summary_budget=60)
+    for index in range(20):
+        context.append("user", f"message {index} " + "palabra " * 40)
+    context.build("A1")
+    assert all(len(line) <= len("user: ") + SUMMARY_LINE_CHARS + 3 for line in context.summary_lines)
+    assert estimate_tokens(context.summary) <= 60
+    # The oldest lines are dropped first
+    assert context.summary_lines[-1].startswith("user: message 18 ")
+
+
+def test_token_accounting_includes_summary_and_instructions():
+    context = ConversationContext()
+    context.append("user", "hola")
+    context.build("B1", instructions="x" * 40)
+    assert context.last_turn_tokens == estimate_tokens("hola") + MESSAGE_OVERHEAD_TOKENS + estimate_tokens("x" * 40)
+    assert context.turns == 1 and context.total_tokens_sent == context.last_turn_tokens
+
+
+def test_retract_only_takes_back_the_matching_newest_message():
+    context = ConversationContext()
+    context.append("assistant", "¿Y tú?")
+    context.append("user", "bien")
+    assert not context.retract("user", "mal")
+    assert context.retract("user", "bien")
+    assert not context.retract("user", "bien")
+    assert context.messages == [{"role": "assistant", "content": "¿Y tú?"}]
+
+
+def test_state_round_trips():
+    context = ConversationContext(budgets={"A1": 1})
+    for text in ("uno", "dos", "tres"):
+        context.append("user", text)
+    context.build("A1")
+    restored = ConversationContext()
+    restored.load_state(context.to_state())
+    assert restored.messages == context.messages and restored.summary == context.summary
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+import elo
+
+
+# The per-learner versions server.py used before elo.py, kept here as the reference
+def scalar_random_elo(user_rating, rng, std_dev=400):
+    random_elo = int(rng.normal(user_rating, std_dev))
+    return max(0, min(2000, random_elo))
+
+
+def scalar_cefr(elo_rating):
+    if 0 <= elo_rating <= 333:
+        return "A1"
+    elif 334 <= elo_rating <= 666:
+        return "A2"
+    elif 667 <= elo_rating <= 1000:
+        return "B1"
+    elif 1001 <= elo_rating <= 1333:
+        return "B2"
+    elif 1334 <= elo_rating <= 1666:
+        return "C1"
+    elif 1667 <= elo_rating <= 2000:
+        return "C2"
+    else:
+        return "Unknown"
+
+
+def scalar_update(user_rating, performance_score, difficulty_level, k=5):
+    expected_score = 1 / (1 + 10 ** ((difficulty_level - user_rating) / 400))
+    new_rating = user_rating + k * (performance_score - expected_score)
+    if new_rating < 0:
+        new_rating = 0
+    return int(new_rating)
+
+
+def test_cefr_levels_match_the_scalar_buckets():
+    ratings = np.arange(-50, 2051)
+    assert elo.cefr_levels(ratings).tolist() == [scalar_cefr(int(rating)) for rating in ratings]
+
+
+@pytest.mark.parametrize('rating', [-1, 0, 333, 334, 1000, 1001, 2000, 2001])
+def test_cefr_levels_take_scalars(rating):
+    assert str(elo.cefr_levels(rating)) == scalar_cefr(rating)
+
+
+def test_sample_difficulty_matches_the_scalar_draws():
+    ratings = np.random.default_rng(1).integers(0, 2001, 5000)
+    vectorized = elo.sample_difficulty(ratings, rng=np.random.default_rng(7))
+    rng = np.random.default_rng(7)
+    assert vectorized.tolist() == [scalar_random_elo(int(rating), rng) for rating in ratings]
+
+
+def test_update_ratings_matches_the_scalar_update():
+    rng = np.random.default_rng(3)
+    ratings = rng.integers(0, 2001, 20000)
+    difficulty = rng.integers(0, 2001, 20000)
+    performance = rng.uniform(-0.5, 1.5, 20000)
+    expected = [scalar_update(int(r), float(p), int(d)) for r, p, d in zip(ratings, performance, difficulty)]
+    assert elo.update_ratings(ratings, performance, difficulty).tolist() == expected
+
+
+def test_update_ratings_floors_at_zero():
+    assert int(elo.update_ratings(1, 0.0, 2000, k=50)) == 0
+
+
+def test_simulate_converges_toward_true_ratings():
+    true_ratings = np.random.default_rng(0).integers(0, 2001, 2000)
+    result = elo.simulate(true_ratings, turns=200, k=40, rng=np.random.default_rng(0))
+    history = result['history']
+    assert history[-1]['mean_abs_error'] < history[0]['mean_abs_error']
+    assert sum(result['level_distribution'].values()) == pytest.approx(1.0)
@@ -0,0 +1,70 @@
+import pytest
+
+from help_classifier import CHAT_EXAMPLES, HELP_EXAMPLES, HELP_PATTERNS, HelpClassifier
+
+
+@pytest.mark.parametrize('message', [
+    "no entiendo",
+    "No sé.",
+    "no sé",
+    "perdón, no sé qué significa eso",
+    "no se como decirlo",
+    "¿Cómo se dice 'window'?",
+    "what does madrugar mean",
+    "help",
+    "¡Ayuda!",
+    "can you help me with this word?",
+    "I need help",
+    "ayúdame por favor",
+    "¿me puedes ayudar?",
+    "Hilfe!",
+    "hilf mir bitte",
+    "aiutami",
+    "non ho capito.",
+    "how do you say it in English?",
+    "what is 'apple' in spanish?",
+])
+def test_help_patterns_match_requests_for_help(message):
+    assert HELP_PATTERNS.search(message)
+
+
+@pytest.mark.parametrize('message', [
+    "mi hermano no se levanta temprano",
+    "yo no se nada de eso",
+    "yo no sé nada de eso",
+    "bueno, se me olvidó",
+    "Mi hermano me ayuda con la tarea",
+    "I help my mother cook",
+    "Hilfe ist gut, aber ich lerne allein",
+    "non ho capito il film ma era bello",
+    "vimos una película in English ayer",
+    "what is your favorite food in spanish culture?",
+])
+def test_help_patterns_leave_conversation_alone(message):
+    assert not HELP_PATTERNS.search(message)
+
+
+def make_classifier(similarity, english_words=0):
+    # Two-dimensional "word vectors": help examples point one way, chat examples the other
+    def vectorize(text):
+        if text in HELP_EXAMPLES:
+            return [1.0, 0.0]
+        if text in CHAT_EXAMPLES:
+            return [0.0, 1.0]
+        return [1.0 + similarity, 1.0 - similarity]
+
+    return HelpClassifier(english_word_count=lambda message, language: english_words, vectorize=vectorize)
+
+
+def test_target_language_messages_skip_the_english_vectors():
+    classifier = make_classifier(similarity=0.5, english_words=0)
+    assert classifier.classify("me gusta ir con mi hermano", 'Spanish') == 'no'
+    assert classifier.counts['target_language_no'] == 1 and classifier.counts['vector_yes'] == 0
+
+
+def test_vectors_decide_messages_with_english():
+    assert make_classifier(similarity=0.5, english_words=3).classify("why is it like that", 'Spanish') == 'yes'
+    assert make_classifier(similarity=-0.5, english_words=3).classify("I like the beach", 'Spanish') == 'no'
+    classifier = make_classifier(similarity=0.0, english_words=2)
+    assert classifier.classify("ok so", 'Spanish') is None
+    assert classifier.counts['escalated'] == 1
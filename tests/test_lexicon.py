@@ -0,0 +1,61 @@
+import pytest
+
+from lexicon import MappedLexicon, build_lexicon, open_lexicon
+
+WORDS = ['perro', 'gato', 'pero', 'perezoso', 'árbol', 'niño', 'gato', '']
+
+
+@pytest.fixture
+def lexicon(tmp_path):
+    path = str(tmp_path / 'spanish.lex')
+    build_lexicon(WORDS, path)
+    lexicon = MappedLexicon(path)
+    yield lexicon
+    lexicon.close()
+
+
+def test_words_are_deduplicated(lexicon):
+    assert len(lexicon) == 6
+
+
+@pytest.mark.parametrize('word', ['perro', 'gato', 'pero', 'perezoso', 'árbol', 'niño'])
+def test_contains_every_word(lexicon, word):
+    assert word in lexicon
+
+
+@pytest.mark.parametrize('word', ['', 'per', 'perros', 'arbol', 'zorro', 'a'])
+def test_rejects_other_words(lexicon, word):
+    assert word not in lexicon
+
+
+def test_prefix_lists_matches_in_order(lexicon):
+    assert lexicon.prefix('per') == ['perezoso', 'pero', 'perro']
+    assert lexicon.prefix('per', limit=2) == ['perezoso', 'pero']
+    assert lexicon.prefix('x') == []
+
+
+def test_unknown_lowercases_and_skips_numbers(lexicon):
+    assert lexicon.unknown(['Perro', 'GATOS', '42', '3.5', 'niño']) == {'gatos'}
+
+
+def test_open_lexicon_builds_once(tmp_path):
+    path = str(tmp_path / 'nested' / 'words.lex')
+    builds = []
+
+    def words():
+        builds.append(1)
+        return ['uno', 'dos']
+
+    first = open_lexicon(path, words)
+    second = open_lexicon(path, words)
+    assert 'dos' in first and 'uno' in second
+    assert builds == [1]
+    first.close()
+    second.close()
+
+
+def test_rejects_a_file_that_is_not_a_lexicon(tmp_path):
+    path = tmp_path / 'bogus.lex'
+    path.write_bytes(b'NOPE' + bytes(8))
+    with pytest.raises(ValueError):
+        MappedLexicon(str(path))
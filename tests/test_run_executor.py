@@ -0,0 +1,184 @@
+import asyncio
+import itertools
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+# openai_clients builds its HTTP pool on httpx
+pytest.importorskip('httpx')
+pytest.importorskip('openai')
+
+from run_executor import RetryBudget, RunDeadlineExceeded, RunExecutor, RunFailed  # noqa: E402
+
+
+class StubStream:
+    # One run: ('ok',), ('fail', code), ('partial', code), which streams a delta
+    # and then fails, or ('slow', seconds), which blocks until closed
+    def __init__(self, handler, behavior):
+        self.handler = handler
+        self.behavior = behavior
+        self.closed = threading.Event()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def until_done(self):
+        kind, *args = self.behavior
+        run = self.handler.current_run = SimpleNamespace(id=f"run_{id(self)}", status='in_progress', last_error=None)
+        if kind == 'slow':
+            self.closed.wait(args[0])
+            raise ConnectionError("stream closed")
+        if kind == 'partial':
+            self.handler.first_token_at = 1.0
+            self.handler.sink.append(f"partial from {self.handler.thread_id}")
+        if kind in ('fail', 'partial'):
+            run.status, run.last_error = 'failed', SimpleNamespace(code=args[0], message=args[0])
+            return
+        run.status = 'completed'
+        self.handler.current_response = f"reply from {self.handler.thread_id}"
+
+    def close(self):
+        self.closed.set()
+
+
+class AsyncStubStream(StubStream):
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def until_done(self):
+        StubStream.until_done(self)
+
+
+class StubRuns:
+    def __init__(self, behaviors):
+        self.behaviors = iter(behaviors)
+        self.thread_ids = []
+        self.cancelled = []
+        self.stream_class = StubStream
+        self._lock = threading.Lock()
+
+    def stream(self, thread_id, event_handler, **params):
+        with self._lock:
+            self.thread_ids.append(thread_id)
+            behavior = next(self.behaviors)
+        event_handler.thread_id = thread_id
+        return self.stream_class(event_handler, behavior)
+
+    def cancel(self, run_id, thread_id):
+        self.cancelled.append(thread_id)
+
+
+class StubThreadPool:
+    def __init__(self):
+        self.ids = (f"pooled_{n}" for n in itertools.count(1))
+        self.retired = []
+
+    def take(self, role):
+        return SimpleNamespace(id=next(self.ids))
+
+    def retire(self, thread_ids):
+        self.retired.extend(thread_ids)
+
+
+def make_handler(sink=None):
+    return SimpleNamespace(current_run=None, first_token_at=None, current_response=None, sink=[] if sink is None else sink)
+
+
+def make_executor(behaviors, **kwargs):
+    runs = StubRuns(behaviors)
+    client = SimpleNamespace(beta=SimpleNamespace(threads=SimpleNamespace(runs=runs)))
+    pool = StubThreadPool()
+    kwargs.setdefault('base_backoff', 0.001)
+    executor = RunExecutor(client, pool, max_workers=8, **kwargs)
+    return executor, runs, pool
+
+
+def test_first_attempt_wins():
+    executor, runs, _ = make_executor([('ok',)])
+    handler = executor.stream('tutor', 'thread_main', make_handler)
+    assert handler.current_response == "reply from thread_main"
+    assert runs.thread_ids == ['thread_main']
+
+
+def test_failed_run_is_retried_on_the_same_thread():
+    executor, runs, _ = make_executor([('fail', 'server_error'), ('ok',)])
+    handler = executor.stream('tutor', 'thread_main', make_handler)
+    assert handler.current_response == "reply from thread_main"
+    assert runs.thread_ids == ['thread_main', 'thread_main']
+
+
+def test_non_retryable_failure_is_raised():
+    executor, runs, _ = make_executor([('fail', 'invalid_prompt')])
+    with pytest.raises(RunFailed):
+        executor.stream('tutor', 'thread_main', make_handler)
+    assert runs.thread_ids == ['thread_main']
+
+
+def test_retries_stop_when_the_budget_is_spent():
+    executor, runs, _ = make_executor([('fail', 'server_error'), ('ok',)], budget=RetryBudget(max_tokens=0))
+    with pytest.raises(RunFailed):
+        executor.stream('tutor', 'thread_main', make_handler)
+    assert len(runs.thread_ids) == 1
+
+
+def test_hedge_on_a_pooled_thread_wins_and_the_slow_run_is_cancelled():
+    executor, runs, pool = make_executor([('slow', 5), ('ok',)], hedge_roles=['help_detector'], default_hedge_delay=0.05)
+    handler = executor.stream('help_detector', 'thread_scratch', make_handler)
+    assert handler.current_response == "reply from pooled_1"
+    assert runs.thread_ids == ['thread_scratch', 'pooled_1']
+    executor._pool.shutdown(wait=True)
+    assert runs.cancelled == ['thread_scratch']
+    assert pool.retired == ['pooled_1']
+
+
+def test_a_failed_hedge_retries_on_a_new_pooled_thread():
+    executor, runs, pool = make_executor([('slow', 5), ('fail', 'server_error'), ('ok',)],
+                                         hedge_roles=['help_detector'], default_hedge_delay=0.05)
+    handler = executor.stream('help_detector', 'thread_scratch', make_handler)
+    # Never the retired hedge thread, and never no thread at all
+    assert runs.thread_ids == ['thread_scratch', 'pooled_1', 'pooled_2']
+    assert handler.current_response == "reply from pooled_2"
+    executor._pool.shutdown(wait=True)
+    assert sorted(pool.retired) == ['pooled_1', 'pooled_2']
+
+
+def test_deadline_cancels_the_run():
+    executor, runs, _ = make_executor([('slow', 5)], deadlines={'tutor': 0.1})
+    with pytest.raises(RunDeadlineExceeded):
+        executor.stream('tutor', 'thread_main', make_handler)
+    executor._pool.shutdown(wait=True)
+    assert runs.cancelled == ['thread_main']
+
+
+def test_a_run_that_failed_after_streaming_text_is_not_retried():
+    executor, runs, _ = make_executor([('partial', 'server_error'), ('ok',)])
+    sink = []
+    with pytest.raises(RunFailed):
+        executor.stream('tutor', 'thread_conv', lambda: make_handler(sink))
+    assert runs.thread_ids == ['thread_conv']
+    assert sink == ["partial from thread_conv"]
+
+
+def test_async_run_that_failed_after_streaming_text_is_not_retried():
+    executor, runs, _ = make_executor([('partial', 'server_error'), ('ok',)])
+    runs.stream_class = AsyncStubStream
+    async_client = SimpleNamespace(beta=SimpleNamespace(threads=SimpleNamespace(runs=runs)))
+    with pytest.raises(RunFailed):
+        asyncio.run(executor.stream_async(async_client, 'tutor', 'thread_conv', make_handler))
+    assert runs.thread_ids == ['thread_conv']
+
+
+def test_async_failed_run_without_text_is_retried():
+    executor, runs, _ = make_executor([('fail', 'server_error'), ('ok',)])
+    runs.stream_class = AsyncStubStream
+    async_client = SimpleNamespace(beta=SimpleNamespace(threads=SimpleNamespace(runs=runs)))
+    handler = asyncio.run(executor.stream_async(async_client, 'tutor', 'thread_conv', make_handler))
+    assert handler.current_response == "reply from thread_conv"
+    assert runs.thread_ids == ['thread_conv', 'thread_conv']
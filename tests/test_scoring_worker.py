@@ -0,0 +1,55 @@
+import threading
+import time
+
+from scoring_worker import ScoringWorker
+
+
+def test_jobs_for_one_key_run_in_submission_order():
+    worker = ScoringWorker(num_workers=4)
+    ran = {key: [] for key in 'abc'}
+    for index in range(50):
+        for key in 'abc':
+            # Uneven job lengths would reorder jobs if a key could run on two threads
+            worker.submit(key, lambda key, index: (time.sleep(0.001 * (index % 3)), ran[key].append(index)), key, index)
+    worker.join()
+    assert all(ran[key] == list(range(50)) for key in 'abc')
+
+
+def test_jobs_for_one_key_never_overlap():
+    worker = ScoringWorker(num_workers=4)
+    running, overlaps = [0], []
+    lock = threading.Lock()
+
+    def job():
+        with lock:
+            running[0] += 1
+            overlaps.append(running[0])
+        time.sleep(0.002)
+        with lock:
+            running[0] -= 1
+
+    for _ in range(20):
+        worker.submit('session', job)
+    worker.join()
+    assert max(overlaps) == 1
+
+
+def test_different_keys_grade_in_parallel():
+    worker = ScoringWorker(num_workers=2)
+    keys = [key for key in range(100) if hash(key) % 2 == 0][:1] + [key for key in range(100) if hash(key) % 2 == 1][:1]
+    both_started = threading.Barrier(2, timeout=5)
+    results = []
+    for key in keys:
+        worker.submit(key, lambda: results.append(both_started.wait()))
+    worker.join()
+    assert sorted(results) == [0, 1]
+
+
+def test_a_failing_job_does_not_stop_the_queue():
+    worker = ScoringWorker(num_workers=1)
+    ran = []
+    worker.submit('a', lambda: 1 / 0)
+    worker.submit('a', ran.append, 'next')
+    worker.join()
+    assert ran == ['next']
+    assert worker.pending() == 0
@@ -0,0 +1,183 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from sessions import SessionManager
+
+
+def make_manager(**kwargs):
+    built, evicted = [], []
+
+    def factory(session_id):
+        built.append(session_id)
+        return f"chat-{session_id}"
+
+    manager = SessionManager(chat_factory=factory, on_evict=evicted.append, **kwargs)
+    return manager, built, evicted
+
+
+def test_get_builds_once_and_reuses():
+    manager, built, _ = make_manager()
+    first = manager.get('a')
+    assert manager.get('a') is first
+    assert first.chat == 'chat-a'
+    assert built == ['a']
+
+
+def test_least_recently_used_is_evicted_when_full():
+    manager, _, evicted = make_manager(capacity=2)
+    manager.get('a')
+    manager.get('b')
+    manager.get('a')
+    manager.get('c')
+    manager.join_evictions()
+    assert [session.session_id for session in evicted] == ['b']
+    assert 'a' in manager and 'c' in manager and 'b' not in manager
+
+
+def test_idle_sessions_expire():
+    manager, _, evicted = make_manager(idle_ttl=60)
+    manager.get('a')
+    manager.get('b')
+    manager.peek('a').last_used -= 120
+    assert manager.expire() == 1
+    manager.join_evictions()
+    assert [session.session_id for session in evicted] == ['a']
+    assert len(manager) == 1
+
+
+def test_eviction_runs_off_the_requesting_thread_and_waits_for_the_turn():
+    threads = []
+    manager = SessionManager(chat_factory=str, capacity=1,
+                             on_evict=lambda session: threads.append(threading.current_thread()))
+    session = manager.get('a')
+    with session.lock:
+        manager.get('b')
+        time.sleep(0.05)
+        # The turn in progress still holds the lock, so the session is not torn down yet
+        assert threads == []
+    manager.join_evictions()
+    assert threads and threads[0] is not threading.current_thread()
+
+
+def test_concurrent_gets_share_one_build_outside_the_manager_lock():
+    started, release = threading.Event(), threading.Event()
+    builds = []
+
+    def slow_factory(session_id):
+        builds.append(session_id)
+        if session_id == 'slow':
+            started.set()
+            release.wait(5)
+        return session_id
+
+    manager = SessionManager(chat_factory=slow_factory)
+    results = []
+    waiters = [threading.Thread(target=lambda: results.append(manager.get('slow'))) for _ in range(3)]
+    for waiter in waiters:
+        waiter.start()
+    assert started.wait(5)
+    # Other sessions are served while 'slow' is still being built
+    assert manager.get('other').chat == 'other'
+    assert results == []
+    release.set()
+    for waiter in waiters:
+        waiter.join(5)
+    assert builds.count('slow') == 1
+    assert len(results) == 3 and all(session is results[0] for session in results)
+
+
+def test_failed_build_is_retried_by_the_next_get():
+    calls = []
+
+    def flaky_factory(session_id):
+        calls.append(session_id)
+        if len(calls) == 1:
+            raise RuntimeError("store unavailable")
+        return session_id
+
+    manager = SessionManager(chat_factory=flaky_factory)
+    with pytest.raises(RuntimeError):
+        manager.get('a')
+    assert manager.get('a').chat == 'a'
+
+
+def test_async_turns_and_sync_eviction_share_one_lock():
+    manager, _, _ = make_manager()
+    session = manager.get('a')
+
+    async def turn():
+        async with session.async_locked():
+            assert not session.lock.acquire(blocking=False)
+        # Released even though it was waited for on a worker thread
+        assert session.lock.acquire(blocking=False)
+        session.lock.release()
+
+    async def waits_for_sync_holder():
+        session.lock.acquire()
+        asyncio.get_running_loop().call_later(0.05, session.lock.release)
+        async with session.async_locked():
+            pass
+
+    asyncio.run(turn())
+    asyncio.run(waits_for_sync_holder())
+
+
+def test_locked_looks_up_again_when_the_session_was_evicted_while_waiting():
+    built = []
+    manager = SessionManager(chat_factory=lambda session_id: built.append(session_id) or session_id)
+    stale = manager.get('a')
+    stale.lock.acquire()
+    entered = []
+
+    def turn():
+        with manager.locked('a') as session:
+            entered.append(session)
+
+    thread = threading.Thread(target=turn)
+    thread.start()
+    time.sleep(0.05)
+    # What the evictor does: drop the session, then flag it under its lock
+    manager.remove('a')
+    stale.evicted = True
+    stale.lock.release()
+    thread.join(timeout=1)
+    assert entered and entered[0] is not stale and not entered[0].evicted
+    assert built == ['a', 'a']
+
+
+def test_eviction_flags_the_session_under_its_lock():
+    manager, _, evicted = make_manager()
+    session = manager.get('a')
+    manager.remove('a')
+    manager.join_evictions()
+    assert evicted == [session] and session.evicted
+
+
+def test_locked_without_create_yields_none_for_a_missing_session():
+    manager, built, _ = make_manager()
+    with manager.locked('a', create=False) as session:
+        assert session is None
+    assert built == []
+
+
+def test_async_locked_skips_an_evicted_session():
+    manager = SessionManager(chat_factory=str)
+    stale = manager.get('a')
+    stale.lock.acquire()
+
+    def evict():
+        manager.remove('a')
+        stale.evicted = True
+        stale.lock.release()
+
+    async def turn():
+        asyncio.get_running_loop().call_later(0.05, evict)
+        async with manager.async_locked('a') as session:
+            assert session.lock.locked()
+            return session
+
+    session = asyncio.run(turn())
+    assert session is not stale and not session.evicted and not session.lock.locked()
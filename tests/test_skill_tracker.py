@@ -0,0 +1,68 @@
+import pytest
+
+from skill_tracker import SkillTracker
+
+TOPICS = ('Articles', 'Adverbs', 'Numbers')
+
+
+def make_tracker(**kwargs):
+    return SkillTracker(topics=TOPICS, decay_factor=0.5, decay_interval=100, threshold=3, capacity=2, **kwargs)
+
+
+def test_record_counts_repeats_and_ignores_unknown_topics():
+    tracker = make_tracker()
+    tracker.record('a', ['Articles', 'Articles', 'Verbs'], now=0)
+    assert tracker.scores('a', now=0) == {'Articles': 2.0, 'Adverbs': 0.0, 'Numbers': 0.0}
+
+
+def test_scores_decay_lazily_below_the_threshold_only():
+    tracker = make_tracker()
+    tracker.record('a', ['Articles'] * 4 + ['Adverbs'] * 2, now=0)
+    scores = tracker.scores('a', now=100)
+    assert scores['Articles'] == 4.0
+    assert scores['Adverbs'] == pytest.approx(1.0)
+    assert tracker.scores('a', now=300)['Adverbs'] == pytest.approx(0.25)
+
+
+def test_load_replaces_a_learners_scores():
+    tracker = make_tracker()
+    tracker.record('a', ['Numbers'], now=0)
+    tracker.load('a', {'Articles': 5.0, 'Unknown topic': 9.0}, now=0)
+    assert tracker.scores('a', now=0) == {'Articles': 5.0, 'Adverbs': 0.0, 'Numbers': 0.0}
+    assert tracker.recommend('a', now=0) == ['Articles']
+
+
+def test_snapshot_round_trip_keeps_decaying_from_the_save():
+    tracker = make_tracker()
+    tracker.record(('s', 0), ['Adverbs'] * 2, now=0)
+    scores, decayed_at = tracker.snapshot(('s', 0), now=100)
+    assert decayed_at == 100 and scores['Adverbs'] == pytest.approx(1.0)
+    # Loaded again much later: the time in between still counts
+    tracker.load(('s', 1), scores, now=decayed_at)
+    assert tracker.scores(('s', 1), now=200)['Adverbs'] == pytest.approx(0.5)
+
+
+def test_remove_frees_the_column_for_reuse():
+    tracker = make_tracker()
+    tracker.record('a', ['Articles'], now=0)
+    tracker.remove('a')
+    assert len(tracker) == 0
+    assert tracker.scores('a', now=0) == dict.fromkeys(TOPICS, 0.0)
+    tracker.record('b', [], now=0)
+    assert tracker.scores('b', now=0) == dict.fromkeys(TOPICS, 0.0)
+
+
+def test_grows_past_capacity_and_bulk_reads_match():
+    tracker = make_tracker()
+    for index, learner in enumerate('abcde'):
+        tracker.record(learner, ['Adverbs'] * (index + 1), now=0)
+    assert len(tracker) == 5
+    assert tracker.recommend_all(k=2, now=0) == {'c': ['Adverbs'], 'd': ['Adverbs'], 'e': ['Adverbs']}
+    assert tracker.struggling_counts(now=0) == {'Articles': 0, 'Adverbs': 3, 'Numbers': 0}
+
+
+def test_record_counts_adds_a_repeated_learner_twice():
+    tracker = make_tracker()
+    tracker.record_counts(['a', 'b', 'a'], [[1, 0, 2], [0, 1, 0], [0, 0, 0]], now=0)
+    assert tracker.scores('a', now=0)['Articles'] == 3.0
+    assert tracker.scores('b', now=0)['Adverbs'] == 1.0
@@ -0,0 +1,95 @@
+import sqlite3
+import pytest
+
+from state_store import MemoryStateStore, SQLiteStateStore, StateWriter
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    store = MemoryStateStore() if request.param == 'memory' else SQLiteStateStore(str(tmp_path / 'state.db'))
+    yield store
+    store.close()
+
+
+class Owner:
+    def __init__(self, version=0):
+        self.state_version = version
+        self.refused = []
+
+    def state_conflicted(self, deltas):
+        self.refused.append(deltas)
+
+
+def test_new_session_loads_empty_at_version_zero(store):
+    assert store.load('a') == (None, 0)
+    assert store.version('a') == 0
+
+
+def test_save_bumps_the_version(store):
+    assert store.save_many({'a': ({'rating': 1}, 0)}) == {'a': 1}
+    assert store.save_many({'a': ({'rating': 2}, 1)}) == {'a': 2}
+    assert store.load('a') == ({'rating': 2}, 2)
+
+
+def test_stale_write_is_rejected(store):
+    store.save_many({'a': ({'worker': 1}, 0)})
+    assert store.save_many({'a': ({'worker': 2}, 0), 'b': ({'worker': 2}, 0)}) == {'a': None, 'b': 1}
+    assert store.load('a') == ({'worker': 1}, 1)
+
+
+def test_unchecked_write_always_lands(store):
+    store.save_many({'a': ({'n': 1}, 0)})
+    assert store.save_many({'a': ({'n': 2}, None)}) == {'a': 2}
+
+
+def test_writer_advances_the_owner_and_reports_conflicts(store):
+    writer = StateWriter(store, flush_interval=3600)
+    mine, theirs = Owner(), Owner()
+    writer.schedule('a', {'n': 1}, owner=mine)
+    writer.flush()
+    assert mine.state_version == 1
+
+    writer.schedule('a', {'n': 2}, owner=mine)
+    writer.flush()
+    assert mine.state_version == 2 and store.load('a') == ({'n': 2}, 2)
+
+    # A second worker still at version 1 loses the race instead of overwriting
+    theirs.state_version = 1
+    writer.schedule('a', {'n': 'stale'}, owner=theirs, delta={'users_rating': 5})
+    writer.flush()
+    assert theirs.refused == [[{'users_rating': 5}]] and store.load('a') == ({'n': 2}, 2)
+    assert mine.refused == []
+
+
+def test_coalesced_writes_hand_back_every_delta(store):
+    writer = StateWriter(store, flush_interval=3600)
+    store.save_many({'a': ({'n': 0}, 0)})
+    stale = Owner(version=0)
+    writer.schedule('a', {'n': 1}, owner=stale, delta={'users_rating': 3})
+    writer.schedule('a', {'n': 2}, owner=stale, delta={'users_rating': -1})
+    writer.flush()
+    assert stale.refused == [[{'users_rating': 3}, {'users_rating': -1}]]
+
+
+def test_write_replaced_by_another_owner_is_reported(store):
+    writer = StateWriter(store, flush_interval=3600)
+    first, second = Owner(), Owner()
+    writer.schedule('a', {'n': 1}, owner=first, delta={'users_rating': 4})
+    writer.schedule('a', {'n': 2}, owner=second)
+    assert first.refused == [[{'users_rating': 4}]]
+    writer.flush()
+    assert store.load('a') == ({'n': 2}, 1) and second.state_version == 1
+
+
+def test_sqlite_store_upgrades_an_unversioned_table(tmp_path):
+    path = str(tmp_path / 'old.db')
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE learner_state (session_id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)")
+    connection.execute("INSERT INTO learner_state VALUES ('a', '{\"n\": 1}', 0)")
+    connection.commit()
+    connection.close()
+
+    store = SQLiteStateStore(path)
+    assert store.load('a') == ({'n': 1}, 0)
+    assert store.save_many({'a': ({'n': 2}, 0)}) == {'a': 1}
+    store.close()
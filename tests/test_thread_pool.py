@@ -0,0 +1,82 @@
+from types import SimpleNamespace
+
+import pytest
+
+# openai_clients builds its HTTP pool on httpx
+pytest.importorskip('httpx')
+openai = pytest.importorskip('openai')
+
+from thread_pool import AssistantThreadPool  # noqa: E402
+
+
+class StubThreads:
+    # Stands in for client.beta.threads: create() fails while failing is set, or for the next fail_next calls
+    def __init__(self):
+        self.created = 0
+        self.deleted = []
+        self.failing = False
+        self.fail_next = 0
+
+    def create(self):
+        if self.failing or self.fail_next:
+            self.fail_next = max(0, self.fail_next - 1)
+            raise openai.OpenAIError("rate limited")
+        self.created += 1
+        return SimpleNamespace(id=f"thread_{self.created}")
+
+    def delete(self, thread_id):
+        self.deleted.append(thread_id)
+
+
+def make_pool(roles=('thread', 'help_detector_thread'), size=2):
+    threads = StubThreads()
+    client = SimpleNamespace(beta=SimpleNamespace(threads=threads))
+    return AssistantThreadPool(client, roles=roles, size=size, refill_interval=10, max_backoff=40), threads
+
+
+def test_take_uses_the_pool_then_falls_back_inline():
+    pool, threads = make_pool(size=1)
+    pool._refill(now=0)
+    assert pool.ready_counts() == {'thread': 1, 'help_detector_thread': 1}
+    assert pool.take('thread').id == 'thread_1'
+    assert pool.take('thread').id == 'thread_3'
+    assert pool.take('unpooled_thread').id == 'thread_4'
+
+
+def test_a_failing_role_backs_off_without_stopping_the_others():
+    pool, threads = make_pool()
+    threads.fail_next = 1
+    pool._refill(now=0)
+    assert pool.ready_counts() == {'thread': 0, 'help_detector_thread': 2}
+
+    # Still backing off at the next wake-up, then retried
+    pool._refill(now=5)
+    assert pool.ready_counts()['thread'] == 0
+    pool._refill(now=10)
+    assert pool.ready_counts()['thread'] == 2
+
+
+def test_backoff_doubles_up_to_the_limit():
+    pool, threads = make_pool(roles=('thread',))
+    threads.failing = True
+    for now in (0, 10, 30, 70, 110):
+        pool._refill(now=now)
+    assert pool._retry_at['thread'] == 150
+
+
+def test_retired_threads_are_deleted():
+    pool, threads = make_pool()
+    pool.retire(['thread_a', 'thread_b'])
+    pool._delete_retired()
+    assert threads.deleted == ['thread_a', 'thread_b']
+
+
+def test_close_deletes_threads_nobody_took():
+    pool, threads = make_pool(size=1)
+    pool._refill(now=0)
+    taken = pool.take('thread')
+    pool.close()
+    assert sorted(threads.deleted) == ['thread_2']
+    assert taken.id not in threads.deleted
+    pool.close()
+    assert len(threads.deleted) == 1
@@ -0,0 +1,138 @@
+import atexit
+import queue
+import threading
+import time
+
+import openai
+
+from metrics import registry
+from openai_clients import endpoint_limit
+
+thread_takes = registry.counter('converso_thread_pool_takes_total', 'Threads handed to sessions, by role and source (pool or inline).')
+threads_deleted = registry.counter('converso_thread_pool_deleted_total', 'Retired threads deleted in the background, by result.')
+
+
+class AssistantThreadPool:
+    # Keeps `size` pre-created Assistants threads ready per thread role so a new
+    # session gets its threads without waiting on threads.create. A background
+    # worker tops the pools back up after each take and deletes threads that
+    # sessions hand back with retire(). A role whose refill fails backs off on its
+    # own, doubling up to max_backoff seconds. close() deletes the threads still
+    # waiting in the pools, and runs at interpreter exit once started.
+    def __init__(self, client, roles, size=8, refill_interval=30, max_backoff=300):
+        self.client = client
+        self.size = size
+        self.refill_interval = refill_interval
+        self.max_backoff = max_backoff
+        self._ready = {role: queue.Queue() for role in roles}
+        self._retired = queue.Queue()
+        self._failures = dict.fromkeys(self._ready, 0)
+        self._retry_at = dict.fromkeys(self._ready, 0.0)
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+        self._worker = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._worker is None and self.size > 0 and not self._closed.is_set():
+                self._worker = threading.Thread(target=self._run, name='thread-pool', daemon=True)
+                self._worker.start()
+                atexit.register(self.close)
+        return self
+
+    def close(self, timeout=10):
+        # Stops refilling and deletes the pre-created threads no session took
+        with self._start_lock:
+            if self._closed.is_set():
+                return
+            self._closed.set()
+            worker = self._worker
+        self._wake.set()
+        if worker is not None:
+            worker.join(timeout)
+        for ready in self._ready.values():
+            while True:
+                try:
+                    self._retired.put(ready.get_nowait().id)
+                except queue.Empty:
+                    break
+        self._delete_retired()
+
+    def take(self, role):
+        ready = self._ready.get(role)
+        try:
+            if ready is None:
+                raise queue.Empty
+            thread = ready.get_nowait()
+            thread_takes.inc(role=role, source='pool')
+        except queue.Empty:
+            # Pool drained (or a role it does not keep): pay for the round trip inline
+            thread = self._create()
+            thread_takes.inc(role=role, source='inline')
+        self._wake.set()
+        return thread
+
+    def retire(self, thread_ids):
+        for thread_id in thread_ids:
+            self._retired.put(thread_id)
+        if thread_ids:
+            self._wake.set()
+
+    def ready_counts(self):
+        return {role: ready.qsize() for role, ready in self._ready.items()}
+
+    def metric_lines(self):
+        lines = [
+            "# HELP converso_thread_pool_ready Pre-created threads waiting to be handed out, by role.",
+            "# TYPE converso_thread_pool_ready gauge",
+        ]
+        lines.extend(f'converso_thread_pool_ready{{role="{role}"}} {count}' for role, count in sorted(self.ready_counts().items()))
+        return lines
+
+    def _create(self):
+        with endpoint_limit('threads'):
+            return self.client.beta.threads.create()
+
+    def _run(self):
+        while not self._closed.is_set():
+            self._wake.wait(self.refill_interval)
+            self._wake.clear()
+            if self._closed.is_set():
+                return
+            self._refill()
+            self._delete_retired()
+
+    def _refill(self, now=None):
+        now = time.monotonic() if now is None else now
+        for role, ready in self._ready.items():
+            if now < self._retry_at[role]:
+                continue
+            while ready.qsize() < self.size and not self._closed.is_set():
+                try:
+                    ready.put(self._create())
+                except openai.OpenAIError as e:
+                    # Takes fall back to inline creation meanwhile; the other roles still refill
+                    self._failures[role] += 1
+                    backoff = min(self.refill_interval * 2 ** (self._failures[role] - 1), self.max_backoff)
+                    self._retry_at[role] = now + backoff
+                    print(f"Could not pre-create a {role}, retrying in {backoff:.0f}s: {e}")
+                    break
+            else:
+                self._failures[role] = 0
+
+    def _delete_retired(self):
+        while True:
+            try:
+                thread_id = self._retired.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                with endpoint_limit('threads'):
+                    self.client.beta.threads.delete(thread_id)
+                threads_deleted.inc(result='deleted')
+            except openai.NotFoundError:
+                threads_deleted.inc(result='missing')
+            except openai.OpenAIError as e:
+                print(f"Could not delete thread {thread_id}: {e}")
+                threads_deleted.inc(result='failed')
@@ -0,0 +1,165 @@
+import os
+import threading
+import unicodedata
+
+from categories import DEFAULT_CATEGORY
+
+CEFR_LEVELS = ("A1", "A2", "B1", "B2", "C1", "C2")
+CEFR_RANK = {level: rank for rank, level in enumerate(CEFR_LEVELS)}
+
+# Languages whose accents are folded away, so 'estás' and 'estas' match the same entry
+ACCENT_FOLDED_LANGUAGES = {"spanish", "italian", "german"}
+
+# Common inflectional endings, longest first. Stripping them maps conjugated verbs
+# and plural/gendered forms onto a shared stem ('hablamos', 'hablar' -> 'habl').
+# This is deliberately crude; it only has to agree with itself.
+INFLECTION_SUFFIXES = {
+    "spanish": sorted([
+        "aríamos", "eríamos", "iríamos", "ábamos", "aremos", "eremos", "iremos", "asteis", "isteis",
+        "aseis", "ieseis", "iendo", "ieron", "ando", "aron", "amos", "emos", "imos", "aban", "ían",
+        "aste", "iste", "aría", "ería", "iría", "ado", "ada", "ido", "ida", "aba", "ía", "ar", "er",
+        "ir", "as", "es", "an", "en", "os", "ó", "o", "a", "e", "s",
+    ], key=len, reverse=True),
+    "italian": sorted([
+        "eremmo", "iremmo", "avamo", "evamo", "ivamo", "ando", "endo", "iamo", "ato", "ata", "uto",
+        "uta", "ito", "ita", "are", "ere", "ire", "ano", "ono", "ete", "ate", "ite", "a", "e", "i", "o",
+    ], key=len, reverse=True),
+    "german": sorted([
+        "ungen", "ung", "est", "ten", "ern", "en", "er", "es", "em", "te", "st", "et", "e", "n", "s", "t",
+    ], key=len, reverse=True),
+    "russian": sorted([
+        "ешься", "ется", "ются", "ишь", "ите", "ать", "ять", "еть", "ить", "ала", "ила", "ало", "или",
+        "ами", "ями", "ого", "его", "ому", "ему", "ый", "ий", "ая", "яя", "ое", "ее", "ые", "ие", "ем",
+        "им", "ют", "ут", "ат", "ят", "ть", "ла", "ли", "ло", "ом", "ам", "ах", "ов", "ев", "а", "я",
+        "ы", "и", "е", "у", "ю", "о", "й", "ь",
+    ], key=len, reverse=True),
+}
+
+MIN_STEM_LENGTH = 3
+
+
+def load_vocabulary(vocabulary_files, directory='.'):
+    vocabulary = []
+    for vocab_file in vocabulary_files:
+        with open(os.path.join(directory, vocab_file), 'r') as file:
+            vocabulary.extend(file.read().splitlines())
+    return vocabulary
+
+
+def normalize_word(word, language):
+    word = word.strip().lower()
+    if language in ACCENT_FOLDED_LANGUAGES:
+        word = "".join(c for c in unicodedata.normalize("NFD", word) if unicodedata.category(c) != "Mn")
+    return word
+
+
+def stem_word(word, language):
+    for suffix in INFLECTION_SUFFIXES.get(language, ()):
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM_LENGTH:
+            return word[:-len(suffix)]
+    return word
+
+
+class LanguageVocabulary:
+    # Maps every known word form, and every stem, to the lowest CEFR rank it appears at
+    def __init__(self, language, forms, stems):
+        self.language = language
+        self.forms = forms
+        self.stems = stems
+
+    def level_rank(self, word):
+        word = normalize_word(word, self.language)
+        rank = self.forms.get(word)
+        if rank is None:
+            rank = self.stems.get(stem_word(word, self.language))
+        return rank
+
+    def words_above(self, words, cefr_level):
+        limit = CEFR_RANK.get(cefr_level)
+        above = set()
+        if limit is None:
+            return above
+        for word in words:
+            rank = self.level_rank(word)
+            if rank is not None and rank > limit:
+                above.add(word)
+        return above
+
+    def __contains__(self, word):
+        return self.level_rank(word) is not None
+
+    def __len__(self):
+        return len(self.forms)
+
+
+class VocabularyIndex:
+    # Builds a LanguageVocabulary per language from the per-level vocabulary files
+    # named in its categories JSON. Each level's list is cumulative, so a file's
+    # level is the first level that lists it.
+    def __init__(self, category_index, directory=None):
+        self.category_index = category_index
+        self.directory = directory or os.getenv('VOCABULARY_DIR', os.path.dirname(os.path.abspath(__file__)))
+        self._vocabularies = {}
+        self._level_words = {}
+        self._lock = threading.Lock()
+
+    def get(self, language):
+        key = language.lower()
+        vocabulary = self._vocabularies.get(key)
+        if vocabulary is None:
+            with self._lock:
+                vocabulary = self._vocabularies.get(key)
+                if vocabulary is None:
+                    vocabulary = self._build(key)
+                    self._vocabularies[key] = vocabulary
+        return vocabulary
+
+    def words_above_level(self, language, words, cefr_level):
+        return self.get(language).words_above(words, cefr_level)
+
+    def level_words(self, language, cefr_level, category=DEFAULT_CATEGORY):
+        # A level's vocabulary files as written (accents kept), for prompts that list the words
+        level_data = self.category_index.get_level(language, cefr_level, category)
+        if level_data is None:
+            return ()
+        key = (language.lower(), level_data.vocabulary)
+        words = self._level_words.get(key)
+        if words is None:
+            collected = []
+            for vocab_file in level_data.vocabulary:
+                try:
+                    collected.extend(word.strip() for word in load_vocabulary([vocab_file], directory=self.directory))
+                except FileNotFoundError:
+                    print(f"Vocabulary file {vocab_file} not found for {language}")
+            words = self._level_words[key] = tuple(dict.fromkeys(word for word in collected if word))
+        return words
+
+    def _build(self, language):
+        file_ranks = {}
+        levels = self.category_index.get(language).get(DEFAULT_CATEGORY, {})
+        for level in CEFR_LEVELS:
+            level_data = levels.get(level)
+            if level_data is None:
+                continue
+            for vocab_file in level_data.vocabulary:
+                file_ranks.setdefault(vocab_file, CEFR_RANK[level])
+
+        forms = {}
+        stems = {}
+        for vocab_file, rank in file_ranks.items():
+            try:
+                words = load_vocabulary([vocab_file], directory=self.directory)
+            except FileNotFoundError:
+                print(f"Vocabulary file {vocab_file} not found for {language}")
+                continue
+            for word in words:
+                word = normalize_word(word, language)
+                if not word:
+                    continue
+                if rank < forms.get(word, len(CEFR_LEVELS)):
+                    forms[word] = rank
+                stem = stem_word(word, language)
+                if rank < stems.get(stem, len(CEFR_LEVELS)):
+                    stems[stem] = rank
+        print(f"Loaded {len(forms)} {language} vocabulary words")
+        return LanguageVocabulary(language, forms, stems)